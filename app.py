@@ -6,6 +6,7 @@ import pandas as pd
 import os
 import plotly.express as px
 from utils.gee_auth import auth_gee
+from utils.cache_warmer import WARM_CACHE, start_warmer
 from st_on_hover_tabs import on_hover_tabs
 from page import home as home_page
 from page import map as map_page  # Import fungsi dari pages
@@ -19,6 +20,10 @@ if not auth_gee():
         st.error(" Google Earth Engine authentication failed!")
         st.stop()
 
+# Warm the caches in the background, once per process
+if WARM_CACHE:
+    start_warmer()
+
 st.markdown("""
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Space+Grotesk:wght@300..700&display=swap');
@@ -0,0 +1,50 @@
+"""Compare region reductions over the full, simplified and rasterized boundary.
+
+Run from the repository root with the service account in .streamlit/secrets.toml:
+
+    python -m benchmarks.region_geometry [year] [scale]
+"""
+import sys
+import time
+
+import ee
+
+from utils import assets
+from utils.gee_auth import auth_gee
+from utils.region_stats import parse_region_stats, region_stats_query
+from utils.regions import DEFAULT_REGION, reduction_target
+
+MODES = ['full', 'simplified', 'mask']
+
+
+def vertex_count(geometry):
+    # Coordinates flatten to [lon, lat, lon, lat, ...]
+    return ee.Number(geometry.coordinates().flatten().size()).divide(2).getInfo()
+
+
+def run(year, scale):
+    image = ee.Image(assets.agb(year))
+    results = {}
+    for mode in MODES:
+        target_image, geometry = reduction_target(image, DEFAULT_REGION, scale, mode)
+        started = time.perf_counter()
+        stats = parse_region_stats(region_stats_query(target_image, geometry, scale).getInfo())
+        elapsed = time.perf_counter() - started
+        results[mode] = stats
+        print(f"{mode:>10}: {elapsed:6.2f} s, {vertex_count(geometry):>7} vertices, "
+              f"mean {stats['mean']:.3f} t/ha, area {stats['class_areas']['area_ha'].sum():.1f} ha")
+
+    full = results['full']
+    for mode in MODES[1:]:
+        stats = results[mode]
+        mean_diff = abs(stats['mean'] - full['mean']) / full['mean'] * 100
+        full_area = full['class_areas']['area_ha'].sum()
+        area_diff = abs(stats['class_areas']['area_ha'].sum() - full_area) / full_area * 100
+        print(f"{mode:>10} vs full: mean differs by {mean_diff:.3f}%, area by {area_diff:.3f}%")
+
+
+if __name__ == '__main__':
+    if not auth_gee():
+        sys.exit("Google Earth Engine authentication failed")
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else assets.YEARS[-1],
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100)
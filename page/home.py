@@ -1,8 +1,27 @@
 import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
-import ee
+import pandas as pd
 import geemap.foliumap as geemap
+from utils.backends import get_backend
+from utils.map_tiles import tile_layer
+from utils.regions import get_region
+from utils import assets
+
+# Parameter visualisasi yang sesuai dengan GEE
+AGB_VIS_PARAMS = {
+    'bands': 'agbd',
+    'min': 0,
+    'max': 300,
+    'palette': px.colors.sequential.Viridis
+}
+
+TREND_VIS_PARAMS = {
+    'bands': 'agbd',
+    'min': -20,
+    'max': 5,
+    'palette': ['#d73027', '#fc8d59', '#fee08b', '#d9ef8b', '#91cf60']
+}
 
 def show_home():
     st.markdown("""
@@ -139,45 +158,38 @@ def show_home():
      # Sample chart
     st.markdown("### Biomass Trend")
 
+    # Average AGB of every year, from one request over the all-years stack
+    try:
+        yearly = get_backend().yearly_summary()
+        previous = None
+        for col, row in zip(st.columns(len(yearly)), yearly.itertuples()):
+            if pd.isna(row.mean):
+                continue
+            delta = f"{row.mean - previous:+.1f} ton/ha" if previous is not None else None
+            col.metric(label=f"Average AGB {row.year}", value=f"{row.mean:.1f} ton/ha", delta=delta)
+            previous = row.mean
+    except Exception as e:
+        st.error(f"Failed to load yearly summary: {str(e)}")
 
     # 1. Chọn năm và load data AGB tương ứng
     years = [2021, 2022, 2023, 2024]
     selected_year = st.selectbox('Select AGB year:', years, index=0)
-    agb_layer = load_layer(f'projects/seventh-program-460820-u1/assets/Cattien/agb_{selected_year}')
-    agb_trend = load_layer('projects/seventh-program-460820-u1/assets/Cattien/gedi_trend_2021_2024')
 
-    # 2. Parameter visualisasi yang sesuai dengan GEE
-    vis_params_agb_2021 = {
-    'bands': 'agbd',
-    'min': 0,
-    'max': 300,
-    'palette': px.colors.sequential.Viridis
-    }
-
-    vis_params_agb_trend = {
-        'bands': 'agbd',
-        'min': -20,
-        'max': 5,
-        'palette': ['#d73027', '#fc8d59', '#fee08b', '#d9ef8b', '#91cf60']
-    }
-
-    # 3. Buat peta split-panel
-    # Lấy geometry Cat Tien từ asset giống script GEE
-    cat_tien_geom = ee.FeatureCollection('projects/seventh-program-460820-u1/assets/Cat_tien_ranh_gioi').geometry()
-    centroid = cat_tien_geom.centroid().coordinates().getInfo()
-    # centroid trả về [lon, lat]
-    Map = geemap.Map(center=[centroid[1], centroid[0]], zoom=11)
+    # 2. Buat peta split-panel
+    # Tâm bản đồ lấy từ region registry, không cần gọi GEE
+    Map = geemap.Map(center=get_region().center, zoom=11)
     
     # Tambahkan layer với parameter visualisasi
-    left_layer = geemap.ee_tile_layer(agb_layer, vis_params_agb_2021, f'AGB {selected_year}')
-    right_layer = geemap.ee_tile_layer(agb_trend, vis_params_agb_trend, 'Trend AGB')
+    # Map IDs come from the tile URL cache, so only a new year asks Earth Engine
+    left_layer = tile_layer(assets.agb(selected_year), AGB_VIS_PARAMS, f'AGB {selected_year}')
+    right_layer = tile_layer(assets.AGB_TREND, TREND_VIS_PARAMS, 'Trend AGB')
     
     # Split map
     Map.split_map(left_layer, right_layer)
     
     # Tambahkan legenda
-    Map.add_colorbar(vis_params_agb_2021, label=f'AGB {selected_year} (ton/ha)', position='topright')
-    Map.add_colorbar(vis_params_agb_trend, label='Trend AGB 2021-2024 (ton/ha/year)', position='bottomright')
+    Map.add_colorbar(AGB_VIS_PARAMS, label=f'AGB {selected_year} (ton/ha)', position='topright')
+    Map.add_colorbar(TREND_VIS_PARAMS, label='Trend AGB 2021-2024 (ton/ha/year)', position='bottomright')
 
     # Buat 3 kolom: kiri, tengah, kanan
     col1, col2, col3 = st.columns([0.5, 5, 0.5])
@@ -196,11 +208,3 @@ def show_home():
         </p>
     </div>
     """, unsafe_allow_html=True)
-
-
-def load_layer(asset_id):
-    try:
-        return ee.Image(asset_id)
-    except Exception as e:
-        st.error(f"Failed to load data: {str(e)}")
-        return None
@@ -5,6 +5,35 @@ import plotly.graph_objects as go
 import altair as alt
 import pandas as pd
 import ee
+from datetime import datetime
+from streamlit_folium import st_folium
+from utils.ee_executor import fan_out, get_result
+from utils.dashboard_data import fetch_dashboard_data, empty_dashboard_data, table_rows, rows_to_df, HIST_BIN
+from utils.disk_cache import persistent_cache, referenced_assets, expression_key
+from utils.paged_fetch import fetch_table_paged
+from utils.swr import render_deadline, resolve
+from utils.ee_client import get_info
+from utils.backends import get_backend
+from utils.regions import get_region
+from utils.map_tiles import tile_layer
+from utils.roi import DEBOUNCE, normalize_geometry, geometry_hash
+from utils import assets
+
+# Palette colors
+PALETTES = {
+    'Greens': ['f7fcf5', 'e5f5e0', 'c7e9c0', 'a1d99b', '74c476', '41ab5d', '238b45', '006d2c', '00441b'],
+    'Viridis': px.colors.sequential.Viridis,
+    'Plasma': px.colors.sequential.Plasma,
+    'Earth': ['#f7f4f0', '#d4c5a9', '#a67c52', '#6b4423', '#3d2817']
+}
+
+def agb_vis_params(palette):
+    return {
+        'min': 0,
+        'max': 300,
+        'palette': palette,
+        'bands': ['agbd']
+    }
 
 def show_map(year, color_palette):
 
@@ -38,28 +67,6 @@ def show_map(year, color_palette):
     </div>
     """, unsafe_allow_html=True)
 
-    # Get feature collections
-    try:
-        AGBP_per_year_fc = ee.FeatureCollection('projects/seventh-program-460820-u1/assets/Cattien/AGBP_per_year')
-        AGBP_Diff_per_year_fc = ee.FeatureCollection('projects/seventh-program-460820-u1/assets/Cattien/AGBP_Diff_per_year')
-        RMSE_per_year_fc = ee.FeatureCollection('projects/seventh-program-460820-u1/assets/Cattien/RMSE_per_year')
-    except Exception as e:
-        st.error(f"Error loading FeatureCollections: {str(e)}")
-        return
-
-    # Convert to dataframes
-    AGBP_per_year = fc_to_df(AGBP_per_year_fc, ['year', 'total_agb'])
-    AGBP_Diff_per_year = fc_to_df(AGBP_Diff_per_year_fc, ['year', 'change'])
-    RMSE_per_year = fc_to_df(RMSE_per_year_fc, ['year', 'rmse'])
-
-    # Get palette colors
-    palettes = {
-        'Greens': ['f7fcf5', 'e5f5e0', 'c7e9c0', 'a1d99b', '74c476', '41ab5d', '238b45', '006d2c', '00441b'],
-        'Viridis': px.colors.sequential.Viridis,
-        'Plasma': px.colors.sequential.Plasma,
-        'Earth': ['#f7f4f0', '#d4c5a9', '#a67c52', '#6b4423', '#3d2817']
-    }
-
     st.markdown("""
     <div class="main-header">
         <h2 style="margin: 0; text-align: left;">
@@ -73,11 +80,41 @@ def show_map(year, color_palette):
     st.markdown("#### Map Visualization Control")
     years = [2021, 2022, 2023, 2024]
     selected_year = st.selectbox('Year', years, index=years.index(year) if year in years else 0, key="map_year_select")
+
+    # Tables and model metrics come back in one batched request; raster
+    # numbers come from the data backend (Earth Engine or local rasters)
+    backend = get_backend()
+    # Last good value of each call, shown when a fresh one is late or fails
+    swr_keys = {
+        'data': ('dashboard_data', selected_year),
+        'stats': ('region_stats', backend.name, selected_year),
+        'hist': ('histogram', backend.name, selected_year),
+        'yearly': ('yearly_summary', backend.name),
+    }
+    pending = fan_out({
+        'data': lambda: fetch_dashboard_data(selected_year),
+        'stats': lambda: backend.region_stats(selected_year),
+        'hist': lambda: backend.histogram(selected_year),
+        'yearly': backend.yearly_summary,
+    }, page='map', deadline=render_deadline(swr_keys.values()))
+    try:
+        data, as_of = resolve(pending['data'], swr_keys['data'])
+        show_as_of(as_of)
+    except Exception as e:
+        st.error(f"Error loading dashboard data: {str(e)}")
+        data = empty_dashboard_data()
+
+    AGBP_per_year = data['agbp']
+    AGBP_Diff_per_year = data['agbp_diff']
+    RMSE_per_year = data['rmse']
+
     col1, col2 = st.columns([3.3, 0.7])
     
     with col1:
         # Interactive Map
-        display_map(selected_year, palettes[color_palette])
+        map_state = display_map(selected_year, PALETTES[color_palette])
+        display_roi_stats(selected_year, backend, map_state)
+        display_point_series(backend, map_state)
     
     with col2:
         # Top: Statistics
@@ -99,26 +136,26 @@ def show_map(year, color_palette):
         </style>
         """, unsafe_allow_html=True)
         
-        display_stats(selected_year)
+        display_stats(selected_year, pending['stats'], swr_keys['stats'])
         
         st.markdown("<br>", unsafe_allow_html=True)
         
         # Bottom: Model Performance
         st.subheader("Model Performance")
         
-        # Load observed vs predicted data for the year
+        # Accuracy metrics are reduced on the server, only the scalars come back
         try:
-            obs_pred_df = load_observed_vs_predicted(selected_year)
-            rmse_row = RMSE_per_year[RMSE_per_year['year'] == selected_year]
+            metrics = data['metrics']
             
-            if not rmse_row.empty and not obs_pred_df.empty:
-                rmse_val = rmse_row.iloc[0]['rmse']
-                mean_obs = obs_pred_df['agbd'].mean()
-                error_pct = (rmse_val / mean_obs) * 100 if mean_obs != 0 else 0
+            if metrics is not None:
+                mean_obs = metrics['mean_observed']
+                error_pct = (metrics['rmse'] / mean_obs) * 100 if mean_obs != 0 else 0
         
                 # Create donut chart
                 donut_chart = make_donut(error_pct)
                 st.altair_chart(donut_chart, use_container_width=False)
+                r2 = f"{metrics['r2']:.2f}" if metrics['r2'] is not None else "n/a"
+                st.caption(f"R² {r2} · MAE {metrics['mae']:.1f} · Bias {metrics['bias']:+.1f} ton/ha · n = {metrics['count']}")
             else:
                 st.info("No RMSE or observed data for this year.")
         except Exception as e:
@@ -204,19 +241,55 @@ def show_map(year, color_palette):
                 st.plotly_chart(fig1, use_container_width=True)
             else:
                 st.warning("Data Total Aboveground Biomass tidak tersedia.")
+        with col2:
+            # Mean density for all years comes from one reduction over the stacked image
+            try:
+                yearly, as_of = resolve(pending['yearly'], swr_keys['yearly'])
+                yearly = yearly.dropna(subset=['mean'])
+                show_as_of(as_of)
+                fig_mean = px.line(
+                    yearly.sort_values('year'),
+                    x='year', y='mean', markers=True,
+                    labels={'mean': 'Average AGB (ton/ha)', 'year': 'Year'},
+                    title=' '
+                )
+                fig_mean.update_traces(line=dict(color='#9ACD32', width=3), marker=dict(size=8))
+                fig_mean.update_layout(
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    font=dict(color='white', size=18),
+                    title=dict(font=dict(size=24)),
+                    xaxis=dict(
+                        type='category',
+                        showgrid=False,
+                        tickfont=dict(size=16),
+                        title=dict(font=dict(size=18))
+                    ),
+                    yaxis=dict(
+                        showgrid=False,
+                        tickfont=dict(size=16),
+                        title=dict(font=dict(size=18))
+                    ),
+                    height=350,
+                    margin=dict(l=30, r=30, t=40, b=30)
+                )
+                st.plotly_chart(fig_mean, use_container_width=True)
+            except Exception as e:
+                st.error(f"Error loading yearly summary: {str(e)}")
 
     with tab3:
         st.subheader("Aboveground Biomass Distribution", help="Histogram of AGB (ton/ha) values for all pixels in Cát Tiên region")
         try:
-            agb_img = ee.Image(f'projects/seventh-program-460820-u1/assets/Cattien/agb_{selected_year}').select('agbd')
-            geometry = ee.FeatureCollection('projects/seventh-program-460820-u1/assets/Cat_tien_ranh_gioi').geometry()
-            # Lấy giá trị pixel về dưới dạng list (giới hạn 5000 pixel để tránh timeout)
-            values = agb_img.sample(region=geometry, scale=100, geometries=False, numPixels=5000).aggregate_array('agbd').getInfo()
-            import numpy as np
-            import plotly.figure_factory as ff
-            if values and len(values) > 0:
-                values = [v for v in values if v is not None]
-                hist_fig = ff.create_distplot([values], group_labels=["AGB (ton/ha)"], bin_size=10, show_rug=False)
+            hist, as_of = resolve(pending['hist'], swr_keys['hist'])
+            show_as_of(as_of)
+            if not hist.empty and hist['count'].sum() > 0:
+                hist_fig = go.Figure(go.Bar(
+                    x=hist['bin_start'] + HIST_BIN / 2,
+                    y=hist['count'],
+                    width=HIST_BIN,
+                    marker_color='#9ACD32',
+                    name="AGB (ton/ha)"
+                ))
                 hist_fig.update_layout(
                     title=f"AGB Distribution (Histogram) {selected_year}",
                     xaxis_title="AGB (ton/ha)",
@@ -267,6 +340,32 @@ def show_map(year, color_palette):
                 st.plotly_chart(fig2, use_container_width=True)
             else:
                 st.warning("Data RMSE tidak tersedia.")
+        with col2:
+            # Plot-level rows are a large download, so only fetched on request
+            # (page by page, with a progress bar)
+            if st.toggle(f"Show observed vs predicted plots {selected_year}", key="obs_pred_toggle"):
+                obs_pred = load_observed_vs_predicted(selected_year)
+                if not obs_pred.empty:
+                    fig_obs = px.scatter(
+                        obs_pred, x='agbd', y='agbd_predicted', opacity=0.5,
+                        labels={'agbd': 'Observed AGB (ton/ha)', 'agbd_predicted': 'Predicted AGB (ton/ha)'},
+                        title=' '
+                    )
+                    fig_obs.update_traces(marker=dict(color='#9ACD32', size=5))
+                    fig_obs.add_shape(type='line', x0=0, y0=0, x1=300, y1=300,
+                                      line=dict(color='#A9A9A9', dash='dash'))
+                    fig_obs.update_layout(
+                        plot_bgcolor='rgba(0,0,0,0)',
+                        paper_bgcolor='rgba(0,0,0,0)',
+                        font=dict(color='white', size=16),
+                        xaxis=dict(showgrid=False),
+                        yaxis=dict(showgrid=False),
+                        height=350,
+                        margin=dict(l=30, r=30, t=40, b=30)
+                    )
+                    st.plotly_chart(fig_obs, use_container_width=True)
+                else:
+                    st.warning("Observed vs predicted data is not available.")
 
     st.markdown("""
     <div style="text-align: center; margin-top: 3rem; padding: 2rem; 
@@ -280,95 +379,146 @@ def show_map(year, color_palette):
     """, unsafe_allow_html=True)
     
 # --- FeatureCollection to DataFrame ---
-@st.cache_data
-def fc_to_df(_feature_collection, properties):
+# The collection itself is part of the key: it is hashed by its serialized
+# expression, which names the asset (and year) it was loaded from
+@st.cache_data(hash_funcs={ee.FeatureCollection: expression_key})
+@persistent_cache(lambda feature_collection, properties, paged=False: referenced_assets(feature_collection),
+                  should_store=lambda df: not df.empty)
+def fc_to_df(feature_collection, properties, paged=False):
     try:
-        features = _feature_collection.getInfo()['features']
-        data = [{prop: f['properties'].get(prop, None) for prop in properties} for f in features]
-        df = pd.DataFrame(data)
-        return df
+        # Collections past the 5000-element limit are downloaded page by page
+        if paged:
+            return fetch_table_paged(feature_collection, properties)
+        # Fetch only the requested columns instead of every feature's GeoJSON
+        rows = get_info(table_rows(feature_collection, properties))
+        return rows_to_df(rows, properties)
     except Exception as e:
         st.error(f"Error converting FeatureCollection to DataFrame: {str(e)}")
         return pd.DataFrame()
 
 # --- Year-specific FeatureCollections ---
 @st.cache_data
-def load_agb(year: int):
-    try:
-        asset_id = f'projects/seventh-program-460820-u1/assets/Cattien/agb_{year}'
-        return ee.Image(asset_id).select('agbd')
-    except Exception as e:
-        st.error(f"Error loading AGB data for year {year}: {str(e)}")
-        return None
-
-@st.cache_data
+@persistent_cache(lambda year: [assets.observed_vs_predicted(year)], should_store=lambda df: not df.empty)
 def load_observed_vs_predicted(year):
     try:
         # Định nghĩa asset_id cho từng năm, cần đúng tên asset đã export trên GEE
         asset_id = f'projects/seventh-program-460820-u1/assets/Cattien/Observed_vs_Predicted_{year}'
         fc = ee.FeatureCollection(asset_id)
-        return fc_to_df(fc, ['agbd', 'agbd_predicted'])
+        return fc_to_df(fc, ['agbd', 'agbd_predicted'], paged=True)
     except Exception as e:
         st.error(f"Error loading observed vs predicted data for year {year}: {str(e)}")
         return pd.DataFrame()
 
-@st.cache_data
-def get_tanjung_puting_geometry():
-    # Lấy geometry từ asset Cat_tien_ranh_gioi giống script GEE
-    return ee.FeatureCollection('projects/seventh-program-460820-u1/assets/Cat_tien_ranh_gioi').geometry()
-
 def display_map(year, palette):
     try:
-        agb_layer = load_agb(year)
-        if agb_layer is None:
-            st.error(f"AGB data for {year} not available")
-            return
-            
-        # Lấy geometry Cat Tien từ asset giống script GEE
-        cat_tien_geom = ee.FeatureCollection('projects/seventh-program-460820-u1/assets/Cat_tien_ranh_gioi').geometry()
-        centroid = cat_tien_geom.centroid().coordinates().getInfo()
-        # centroid trả về [lon, lat]
-        vis_params = {
-            'min': 0,
-            'max': 300,
-            'palette': palette,
-            'bands': ['agbd']
-        }
-        Map = geemap.Map(center=[centroid[1], centroid[0]], zoom=11)
-        Map.addLayer(agb_layer, vis_params, f'AGB {year}')
+        region = get_region()
+        vis_params = agb_vis_params(palette)
+        Map = geemap.Map(center=region.center, zoom=11)
+        # Tile URL is reused across reruns until its map ID gets old
+        tile_layer(assets.agb(year), vis_params, f'AGB {year}').add_to(Map)
         Map.add_colorbar(vis_params, label="AGB (ton/Ha)")
-        Map.to_streamlit(height=750)
-        
+        Map.add_layer_control()
+        # Bidirectional: shapes drawn with the draw control come back to Python
+        return st_folium(Map, key="agb_map", height=750, use_container_width=True,
+                         returned_objects=["last_active_drawing", "last_clicked"])
+
     except Exception as e:
         st.error(f"Error displaying map: {str(e)}")
 
-def display_stats(year):
+def display_roi_stats(year, backend, map_state):
+    """Statistics for the shape last drawn on the map"""
+    drawing = (map_state or {}).get("last_active_drawing")
+    if not drawing:
+        st.caption("Draw a polygon or rectangle on the map to get statistics for that area.")
+        return
+    geometry = normalize_geometry(drawing)
+    if geometry is None:
+        st.info("Only polygons and rectangles can be used as a region of interest.")
+        return
+
+    # Same shape (even redrawn or starting from another vertex) -> same key,
+    # so reruns and repeated drawings are served from the cache
+    key = geometry_hash(geometry)
+    delay = DEBOUNCE if st.session_state.get("_roi_hash") != key else 0
+    st.session_state["_roi_hash"] = key
+    # A newer drawing cancels this request if it has not started yet
+    pending = fan_out({'roi': lambda: backend.roi_stats(year, geometry)}, page='roi', delay=delay)
+    try:
+        stats = get_result(pending['roi'])
+        if stats is None:
+            st.warning("No AGB pixels inside the drawn area.")
+            return
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("ROI mean AGB", f"{stats['mean']:.1f} ton/ha")
+        col2.metric("ROI total AGB", f"{stats['total_t']:,.0f} ton" if stats['total_t'] is not None else "n/a")
+        col3.metric("ROI min / max", f"{stats['min']:.0f} / {stats['max']:.0f}")
+        col4.metric("Pixels", f"{stats['count']:,}")
+    except Exception as e:
+        st.error(f"Error calculating ROI statistics: {str(e)}")
+
+def display_point_series(backend, map_state):
+    """AGB of the clicked pixel for every year, plus its trend"""
+    clicked = (map_state or {}).get("last_clicked")
+    if not clicked:
+        return
+    try:
+        series = backend.point_series(clicked["lng"], clicked["lat"])
+        values = pd.DataFrame({'year': list(series['agbd']), 'agbd': list(series['agbd'].values())}).dropna()
+        if values.empty:
+            st.info("No AGB data at the clicked location.")
+            return
+        trend = f"{series['trend']:+.2f} ton/ha/year" if series['trend'] is not None else "n/a"
+        st.markdown(f"**Clicked pixel** ({clicked['lat']:.4f}, {clicked['lng']:.4f}) · Trend 2021-2024: {trend}")
+        fig = px.line(values, x='year', y='agbd', markers=True,
+                      labels={'agbd': 'AGB (ton/ha)', 'year': 'Year'})
+        fig.update_traces(line=dict(color='#9ACD32', width=3), marker=dict(size=8))
+        fig.update_layout(
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='white', size=14),
+            xaxis=dict(type='category', showgrid=False),
+            yaxis=dict(showgrid=False),
+            height=250,
+            margin=dict(l=30, r=30, t=20, b=30)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    except Exception as e:
+        st.error(f"Error loading pixel time series: {str(e)}")
+
+def show_as_of(as_of):
+    """Note under a value served from the last good copy"""
+    if as_of is not None:
+        st.caption(f"As of {datetime.fromtimestamp(as_of):%Y-%m-%d %H:%M} · refreshing in the background")
+
+def display_stats(year, pending_stats, swr_key):
     """Display statistics for selected year"""
     try:
-        agb_layer = load_agb(year)
-        if agb_layer is None:
+        stats, as_of = resolve(pending_stats, swr_key)
+        if stats is None:
             st.error(f"AGB data for {year} not available")
             return
-            
-        geometry = get_tanjung_puting_geometry()
         
-        stats = agb_layer.reduceRegion(
-            reducer=ee.Reducer.mean().combine(
-                ee.Reducer.min(), '', True
-            ).combine(
-                ee.Reducer.max(), '', True
-            ),
-            geometry=geometry,
-            scale=100,
-            maxPixels=1e10
-        ).getInfo()
-        
-        agb_mean = stats.get('agbd_mean', 0)
-        if agb_mean is None:
-            agb_mean = 0
+        agb_mean = stats['mean']
         st.metric(label=f"Average AGB {year}", 
                   value=f"{agb_mean:.1f} ton/ha",
                   help="Average aboveground biomass value per hectare (Density)")
+        st.metric(label=f"Median AGB {year}",
+                  value=f"{stats['p50']:.1f} ton/ha",
+                  help="Half of the pixels have a lower biomass density than this value")
+
+        show_as_of(as_of)
+
+        with st.expander("More statistics"):
+            st.markdown(
+                f"**Min / Max:** {stats['min']:.1f} / {stats['max']:.1f} ton/ha  \n"
+                f"**Std. deviation:** {stats['stddev']:.1f} ton/ha  \n"
+                f"**P10 / P90:** {stats['p10']:.1f} / {stats['p90']:.1f} ton/ha"
+            )
+            st.dataframe(
+                stats['class_areas'].rename(columns={'class': 'AGB class (ton/ha)', 'area_ha': 'Area (ha)'}),
+                hide_index=True,
+                use_container_width=True
+            )
         
     except Exception as e:
         st.error(f"Error calculating stats: {str(e)}")
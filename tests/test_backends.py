@@ -0,0 +1,129 @@
+import json
+
+import numpy as np
+import pytest
+
+from utils import assets, pixels
+from utils.backends import LocalBackend, raster_histogram, raster_region_stats
+from utils.local_rasters import Raster, open_raster, raster_path, save_raster
+from utils.region_stats import CLASS_COUNT
+
+BBOX = [107.0, 11.0, 107.005, 11.004]  # 5 × 4 pixels of 0.001°
+DATA = np.array([
+    [10, 60, 110, np.nan, 400],
+    [20, 70, 120, 170, 220],
+    [30, 80, np.nan, 180, 230],
+    [40, 90, 140, 190, 240],
+], dtype=np.float32)
+
+
+def export(directory, year, data):
+    """Write a raster the way a hand export would: .npy plus a bbox-only sidecar."""
+    np.save(raster_path(year, directory), data)
+    with open(raster_path(year, directory, '.json'), 'w') as f:
+        json.dump({'bbox': BBOX}, f)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    for offset, year in enumerate(assets.YEARS):
+        export(str(tmp_path), year, DATA + 10 * offset)
+    open_raster.cache_clear()
+    yield LocalBackend(str(tmp_path), download_missing=False)
+    open_raster.cache_clear()
+
+
+def test_region_stats():
+    stats = raster_region_stats(Raster(DATA, BBOX))
+    values = DATA[np.isfinite(DATA)]
+    assert stats['mean'] == pytest.approx(values.mean())
+    assert (stats['min'], stats['max']) == (10, 400)
+    assert stats['stddev'] == pytest.approx(values.std())
+    assert stats['p50'] == pytest.approx(np.percentile(values, 50))
+    # Every valid pixel falls in one class; 400 is clamped into the last one
+    area = Raster(DATA, BBOX).row_area_ha()
+    assert stats['class_areas']['area_ha'].sum() == pytest.approx((np.isfinite(DATA) * area[:, None]).sum())
+    assert len(stats['class_areas']) == CLASS_COUNT
+    assert stats['class_areas']['area_ha'].iloc[-1] == pytest.approx(area[0])
+
+
+def test_region_stats_without_data():
+    assert raster_region_stats(Raster(np.full((2, 2), np.nan, dtype=np.float32), BBOX)) is None
+
+
+def test_histogram():
+    hist = raster_histogram(Raster(DATA, BBOX))
+    assert hist['count'].sum() == 17  # 400 is past the last bin
+    assert hist.loc[hist['bin_start'] == 10, 'count'].item() == 1
+    assert hist.loc[hist['bin_start'] == 0, 'count'].item() == 0
+
+
+def test_backend_reads_exported_rasters(backend):
+    assert backend.region_stats(2021)['mean'] == pytest.approx(raster_region_stats(Raster(DATA, BBOX))['mean'])
+    assert backend.histogram(2022)['count'].sum() == 17
+
+
+def test_yearly_summary(backend):
+    summary = backend.yearly_summary()
+    assert summary['year'].tolist() == assets.YEARS
+    base = np.nanmean(DATA)
+    assert summary['mean'].tolist() == pytest.approx([base + 10 * i for i in range(len(assets.YEARS))])
+    assert summary['max'].tolist() == pytest.approx([400 + 10 * i for i in range(len(assets.YEARS))])
+
+
+def test_point_series(backend):
+    # Centre of row 1, column 2
+    series = backend.point_series(107.0025, 11.0025)
+    assert series['agbd'] == {year: pytest.approx(120 + 10 * i) for i, year in enumerate(assets.YEARS)}
+    assert series['trend'] is None
+    # Masked pixel and outside the grid
+    assert set(backend.point_series(107.0035, 11.0035)['agbd'].values()) == {None}
+    assert set(backend.point_series(100.0, 11.0)['agbd'].values()) == {None}
+
+
+def test_missing_raster(tmp_path):
+    open_raster.cache_clear()
+    with pytest.raises(FileNotFoundError):
+        LocalBackend(str(tmp_path), download_missing=False).histogram(2021)
+
+
+@pytest.fixture
+def earth_engine(monkeypatch):
+    """Earth Engine reports version v2 of every asset; downloads are recorded."""
+    downloads = []
+
+    def fetch_pixels(year):
+        downloads.append(year)
+        return Raster(np.full((2, 2), 1.0, dtype=np.float32), BBOX)
+
+    monkeypatch.setattr(pixels, 'asset_update_times', lambda asset_ids: ['v2' for _ in asset_ids])
+    monkeypatch.setattr(pixels, 'fetch_pixels', fetch_pixels)
+    return downloads
+
+
+def test_hand_exports_are_never_replaced(backend, earth_engine, tmp_path):
+    local = LocalBackend(str(tmp_path))
+    square = {'type': 'Polygon', 'coordinates': [[[107.0, 11.0], [107.005, 11.0], [107.005, 11.004],
+                                                   [107.0, 11.004], [107.0, 11.0]]]}
+    assert local.roi_stats(2021, square)['count'] == 18
+    assert local.region_stats(2021)['max'] == 400
+    assert earth_engine == []
+    assert np.load(raster_path(2021, str(tmp_path))).shape == DATA.shape
+
+
+def test_downloaded_rasters_follow_their_asset(earth_engine, tmp_path):
+    directory = str(tmp_path)
+    save_raster(2021, DATA, BBOX, 'v1', directory)
+    raster = pixels.ensure_raster(2021, directory)
+    assert earth_engine == [2021]
+    assert raster.shape == (2, 2) and raster.update_time == 'v2'
+    assert pixels.ensure_raster(2021, directory).update_time == 'v2'
+    assert earth_engine == [2021]
+
+
+def test_missing_rasters_are_downloaded_once(earth_engine, tmp_path):
+    directory = str(tmp_path)
+    assert pixels.ensure_raster(2022, directory, download=False) is None
+    assert pixels.ensure_raster(2022, directory).shape == (2, 2)
+    assert pixels.ensure_raster(2022, directory).shape == (2, 2)
+    assert earth_engine == [2022]
@@ -0,0 +1,24 @@
+import numpy as np
+
+from utils.dashboard_data import rows_to_df
+
+
+def test_compact_dtypes():
+    df = rows_to_df([[2021, 1.5], [2022, 2.5]], ['year', 'rmse'])
+    assert df['year'].dtype == np.int16
+    assert df['rmse'].dtype == np.float32
+    assert df['year'].tolist() == [2021, 2022]
+
+
+def test_null_rows():
+    df = rows_to_df([[2021, 1.0], [None, 2.0], [2022, None]], ['year', 'total_agb'])
+    # A row without a year is dropped; a missing value is NaN
+    assert df['year'].tolist() == [2021, 2022]
+    assert df['year'].dtype == np.int16
+    assert df['total_agb'].iloc[0] == 1.0 and np.isnan(df['total_agb'].iloc[1])
+
+
+def test_empty():
+    df = rows_to_df(None, ['year', 'change'])
+    assert df.empty and list(df.columns) == ['year', 'change']
+    assert rows_to_df([[None, 1.0]], ['year', 'change']).empty
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+import types
+
+import pytest
+
+from utils import disk_cache
+
+
+class FakeComputedObject:
+    def __init__(self, node):
+        self.node = node
+
+    def serialize(self):
+        return json.dumps({'result': '0', 'values': {'0': self.node}}, sort_keys=True)
+
+
+class FakeFeatureCollection(FakeComputedObject):
+    def __init__(self, asset_id):
+        super().__init__({'functionInvocationValue': {
+            'functionName': 'Collection.loadTable',
+            'arguments': {'tableId': {'constantValue': asset_id}},
+        }})
+
+
+fake_ee = types.SimpleNamespace(ComputedObject=FakeComputedObject, FeatureCollection=FakeFeatureCollection)
+
+
+def observed_vs_predicted(year):
+    return FakeFeatureCollection(f'projects/test/assets/Cattien/Observed_vs_Predicted_{year}')
+
+
+def wait_for_revalidation():
+    deadline = time.monotonic() + 5
+    while disk_cache._revalidating:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(disk_cache, 'ee', fake_ee)
+    monkeypatch.setattr(disk_cache, 'asset_update_times', lambda asset_ids: ['v1' for _ in asset_ids])
+    store = disk_cache.DiskCache(str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(disk_cache, '_cache', store)
+    return store
+
+
+def test_expression_key_differs_per_year():
+    keys = {disk_cache.expression_key(observed_vs_predicted(year)) for year in [2021, 2022, 2023, 2024]}
+    assert len(keys) == 4
+    assert disk_cache.expression_key(observed_vs_predicted(2021)) == disk_cache.expression_key(observed_vs_predicted(2021))
+
+
+def test_referenced_assets_names_the_year():
+    assert disk_cache.referenced_assets(observed_vs_predicted(2023)) == [
+        'projects/test/assets/Cattien/Observed_vs_Predicted_2023']
+
+
+def test_years_never_collide(cache):
+    calls = []
+
+    # The persistent layer alone; tests/test_map_cache.py goes through page.map.fc_to_df
+    @disk_cache.persistent_cache(lambda fc, properties: disk_cache.referenced_assets(fc))
+    def fc_to_df(fc, properties):
+        calls.append(fc.serialize())
+        return disk_cache.referenced_assets(fc)[0]
+
+    properties = ['agbd', 'agbd_predicted']
+    for _ in range(2):
+        for year in [2021, 2022]:
+            assert fc_to_df(observed_vs_predicted(year), properties).endswith(f'_{year}')
+    # One entry per year; the second round is served from the cache
+    assert len(calls) == 2
+
+
+def test_asset_update_invalidates(cache, monkeypatch):
+    calls = []
+
+    @disk_cache.persistent_cache(lambda fc: disk_cache.referenced_assets(fc))
+    def load(fc):
+        calls.append(1)
+        return len(calls)
+
+    assert load(observed_vs_predicted(2021)) == 1
+    assert load(observed_vs_predicted(2021)) == 1
+    wait_for_revalidation()
+    monkeypatch.setattr(disk_cache, 'asset_update_times', lambda asset_ids: ['v2' for _ in asset_ids])
+    # Served at once while the update is noticed in the background
+    assert load(observed_vs_predicted(2021)) == 1
+    wait_for_revalidation()
+    assert load(observed_vs_predicted(2021)) == 2
+
+
+def test_hits_do_not_wait_for_earth_engine(cache, monkeypatch):
+    @disk_cache.persistent_cache(lambda fc: disk_cache.referenced_assets(fc))
+    def load(fc):
+        return 'value'
+
+    assert load(observed_vs_predicted(2021)) == 'value'
+    wait_for_revalidation()
+    release = threading.Event()
+    monkeypatch.setattr(disk_cache, 'asset_update_times', lambda asset_ids: release.wait(5) and ['v1'])
+
+    started = time.monotonic()
+    assert load(observed_vs_predicted(2021)) == 'value'
+    assert time.monotonic() - started < 1
+    release.set()
+    wait_for_revalidation()
@@ -0,0 +1,204 @@
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import disk_cache, ee_client
+from utils.ee_client import BACKGROUND, INTERACTIVE, Scheduler
+
+
+class HttpError(Exception):
+    """Like googleapiclient.errors.HttpError: the status is on .resp."""
+
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.resp = types.SimpleNamespace(status=status)
+
+
+class FakeEarthEngine:
+    """ee.data stand-in that throttles the first `throttled` calls."""
+
+    def __init__(self, throttled=0, error=None):
+        self.throttled = throttled
+        self.error = error
+        self.calls = []
+        self.data = self
+
+    def getAsset(self, asset_id):
+        self.calls.append(asset_id)
+        if self.error is not None:
+            raise self.error
+        if len(self.calls) <= self.throttled:
+            raise HttpError(429)
+        return {'id': asset_id, 'updateTime': '2024-01-01T00:00:00Z'}
+
+
+def scheduler(**kwargs):
+    sleeps = []
+    kwargs.setdefault('rate', 1000)
+    return Scheduler(sleep=sleeps.append, **kwargs), sleeps
+
+
+def test_retries_throttling():
+    fake = FakeEarthEngine(throttled=2)
+    s, sleeps = scheduler()
+
+    assert s.run(lambda: fake.getAsset('a'))['id'] == 'a'
+    assert len(fake.calls) == 3
+    assert len(sleeps) == 2
+    assert s.stats()['retries'] == 2
+
+
+def test_gives_up_after_max_retries():
+    fake = FakeEarthEngine(throttled=10)
+    s, sleeps = scheduler(max_retries=3)
+
+    with pytest.raises(HttpError):
+        s.run(lambda: fake.getAsset('a'))
+    assert len(fake.calls) == 4
+    assert s.stats()['failed'] == 1
+
+
+@pytest.mark.parametrize('error', [HttpError(400), HttpError(404), ValueError('Image.load: Asset not found')])
+def test_permanent_errors_are_not_retried(error):
+    fake = FakeEarthEngine(error=error)
+    s, sleeps = scheduler()
+
+    with pytest.raises(type(error)):
+        s.run(lambda: fake.getAsset('a'))
+    assert len(fake.calls) == 1
+    assert sleeps == []
+
+
+def test_get_asset_fails_fast(monkeypatch):
+    fake = FakeEarthEngine(throttled=10)
+    s, sleeps = scheduler()
+    monkeypatch.setattr(ee_client, 'ee', fake)
+    monkeypatch.setattr(ee_client, '_scheduler', s)
+
+    with pytest.raises(HttpError):
+        ee_client.get_asset('a')
+    assert len(fake.calls) == 1
+
+
+def test_failed_asset_lookups_are_remembered(monkeypatch):
+    fake = FakeEarthEngine(error=HttpError(503))
+    monkeypatch.setattr(ee_client, 'ee', fake)
+    monkeypatch.setattr(ee_client, '_scheduler', scheduler()[0])
+    monkeypatch.setattr(disk_cache, '_update_times', {})
+
+    assert disk_cache.asset_update_times(['a']) == [None]
+    assert disk_cache.asset_update_times(['a']) == [None]
+    assert len(fake.calls) == 1
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_interactive_overtakes_background():
+    s, _ = scheduler(max_concurrent=1)
+    release = threading.Event()
+    order = []
+
+    blocker = threading.Thread(target=s.run, args=(release.wait,))
+    blocker.start()
+    wait_until(lambda: s.stats()['running'] == 1)
+    threads = []
+    for name, level in [('background 1', BACKGROUND), ('background 2', BACKGROUND), ('interactive', INTERACTIVE)]:
+        threads.append(threading.Thread(target=s.run, args=(lambda name=name: order.append(name), level)))
+        threads[-1].start()
+        wait_until(lambda: s.stats()['queued'] == len(threads))
+    release.set()
+    for thread in [blocker, *threads]:
+        thread.join()
+
+    assert order == ['interactive', 'background 1', 'background 2']
+
+
+def test_interactive_caller_raises_joined_background_request():
+    s, _ = scheduler(max_concurrent=1)
+    release = threading.Event()
+    order = []
+
+    def call(key, name, level):
+        with ee_client.priority(level):
+            ee_client.single_flight(key, lambda: s.run(lambda: order.append(name)))
+
+    blocker = threading.Thread(target=s.run, args=(release.wait,))
+    blocker.start()
+    wait_until(lambda: s.stats()['running'] == 1)
+    threads = []
+    for key, name in [('other', 'background'), ('shared', 'joined')]:
+        threads.append(threading.Thread(target=call, args=(key, name, BACKGROUND)))
+        threads[-1].start()
+        wait_until(lambda: s.stats()['queued'] == len(threads))
+    before = ee_client.coalesce_stats()['coalesced']
+    follower = threading.Thread(target=call, args=('shared', 'follower', INTERACTIVE))
+    follower.start()
+    wait_until(lambda: ee_client.coalesce_stats()['coalesced'] == before + 1)
+    release.set()
+    for thread in [blocker, *threads, follower]:
+        thread.join()
+
+    # The joined request ran first and only once
+    assert order == ['joined', 'background']
+
+
+def test_priority_context():
+    s, _ = scheduler(max_concurrent=1)
+    levels = []
+    original = s._acquire
+    s._acquire = lambda ticket: (levels.append(ticket.level), original(ticket))
+    with ee_client.priority(BACKGROUND):
+        s.run(lambda: None)
+    s.run(lambda: None)
+    assert levels == [BACKGROUND, INTERACTIVE]
+
+
+def test_token_bucket_paces_requests():
+    s, _ = scheduler(rate=50, burst=2)
+    started = time.monotonic()
+    for _ in range(7):
+        s.run(lambda: None)
+    # The burst goes out at once, the other five wait 1/50 s each
+    assert time.monotonic() - started >= 5 / 50 * 0.9
+
+
+def test_single_flight_coalesces():
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait()
+        return 'value'
+
+    before = ee_client.coalesce_stats()['requests']
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(ee_client.single_flight('key', fetch)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: ee_client.coalesce_stats()['requests'] == before + 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['value'] * 4
+    assert len(calls) == 1
+
+
+def test_priority_reaches_pool_threads():
+    def level():
+        return ee_client._priority.get()
+
+    with ThreadPoolExecutor(max_workers=2) as pool, ee_client.priority(BACKGROUND):
+        assert pool.submit(level).result() == INTERACTIVE
+        assert pool.submit(ee_client.keep_priority(level)).result() == BACKGROUND
+        assert list(pool.map(ee_client.keep_priority(lambda _: level()), range(4))) == [BACKGROUND] * 4
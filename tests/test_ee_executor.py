@@ -0,0 +1,56 @@
+import threading
+import time
+import types
+from concurrent.futures import CancelledError
+
+import pytest
+
+from utils import ee_executor
+from utils.ee_executor import fan_out, get_result
+
+
+@pytest.fixture(autouse=True)
+def session(monkeypatch):
+    monkeypatch.setattr(ee_executor, 'st', types.SimpleNamespace(session_state={}))
+
+
+def test_runs_calls_together():
+    started = time.monotonic()
+    futures = fan_out({name: lambda name=name: time.sleep(0.2) or name for name in 'abc'}, page='test')
+    assert {name: get_result(f) for name, f in futures.items()} == {'a': 'a', 'b': 'b', 'c': 'c'}
+    assert time.monotonic() - started < 0.5
+
+
+def test_deadline():
+    release = threading.Event()
+    futures = fan_out({'slow': release.wait}, page='test', deadline=0.1)
+    with pytest.raises(TimeoutError):
+        get_result(futures['slow'])
+    release.set()
+
+
+def test_superseded_delayed_call_never_runs():
+    ran = []
+    first = {}
+    rerun = threading.Thread(target=lambda: first.update(
+        fan_out({'stats': lambda: ran.append('first')}, page='roi', delay=0.5)))
+    rerun.start()
+    time.sleep(0.1)
+    # A newer rerun of the same page while the first is still in its delay
+    second = fan_out({'stats': lambda: ran.append('second')}, page='roi', delay=0.1)
+    rerun.join()
+
+    get_result(second['stats'])
+    time.sleep(0.5)
+    assert ran == ['second']
+    with pytest.raises(CancelledError):
+        first['stats'].result()
+
+
+def test_other_pages_are_not_cancelled():
+    ran = []
+    fan_out({'a': lambda: ran.append('map')}, page='map', delay=0.1, deadline=0)
+    futures = fan_out({'a': lambda: ran.append('home')}, page='home', delay=0.1)
+    get_result(futures['a'])
+    time.sleep(0.1)
+    assert sorted(ran) == ['home', 'map']
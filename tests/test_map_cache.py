@@ -0,0 +1,80 @@
+"""fc_to_df through both of its caches, with Earth Engine faked out."""
+import types
+
+import ee
+import pytest
+
+from utils import assets, disk_cache
+from utils.dashboard_data import rows_to_df
+from test_disk_cache import FakeFeatureCollection
+
+pytest.importorskip('streamlit')
+page_map = pytest.importorskip('page.map')
+
+COLUMNS = ['agbd', 'agbd_predicted']
+ROWS = {year: [[year + 0.1, year + 0.2]] for year in [2021, 2022]}
+
+
+def feature_collection(asset_id):
+    """A real ee.FeatureCollection, so st.cache_data applies its hash_funcs, with a fake expression."""
+    fc = ee.FeatureCollection.__new__(ee.FeatureCollection)
+    fc.serialize = FakeFeatureCollection(asset_id).serialize
+    fc.asset_id = asset_id
+    return fc
+
+
+def rows_for(fc):
+    return next(rows for year, rows in ROWS.items() if fc.asset_id == assets.observed_vs_predicted(year))
+
+
+@pytest.fixture
+def calls(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(disk_cache, '_cache', disk_cache.DiskCache(str(tmp_path / 'cache.sqlite')))
+    monkeypatch.setattr(disk_cache, 'asset_update_times', lambda asset_ids: ['v1' for _ in asset_ids])
+    monkeypatch.setattr(page_map, 'ee', types.SimpleNamespace(FeatureCollection=feature_collection))
+    monkeypatch.setattr(page_map, 'table_rows', lambda fc, columns: fc)
+    monkeypatch.setattr(page_map, 'get_info', lambda fc: calls.append(fc.asset_id) or rows_for(fc))
+    monkeypatch.setattr(page_map, 'fetch_table_paged',
+                        lambda fc, columns: calls.append(fc.asset_id) or rows_to_df(rows_for(fc), columns))
+    page_map.fc_to_df.clear()
+    page_map.load_observed_vs_predicted.clear()
+    yield calls
+    page_map.fc_to_df.clear()
+    page_map.load_observed_vs_predicted.clear()
+
+
+def fc_to_df(year):
+    return page_map.fc_to_df(feature_collection(assets.observed_vs_predicted(year)), COLUMNS)
+
+
+def assert_year(df, year):
+    assert df.values.ravel().tolist() == pytest.approx(sum(ROWS[year], []))
+
+
+def test_memory_cache_is_per_year(calls):
+    for year in ROWS:
+        assert_year(fc_to_df(year), year)
+    hits = disk_cache.cache_stats()['hits']
+    for year in ROWS:
+        assert_year(fc_to_df(year), year)
+    assert len(calls) == 2
+    # Served by st.cache_data, without reaching the disk cache
+    assert disk_cache.cache_stats()['hits'] == hits
+
+
+def test_disk_cache_is_per_year(calls):
+    for year in ROWS:
+        fc_to_df(year)
+    page_map.fc_to_df.clear()
+    hits = disk_cache.cache_stats()['hits']
+    for year in ROWS:
+        assert_year(fc_to_df(year), year)
+    assert len(calls) == 2
+    assert disk_cache.cache_stats()['hits'] == hits + 2
+
+
+def test_load_observed_vs_predicted(calls):
+    for year in ROWS:
+        assert_year(page_map.load_observed_vs_predicted(year), year)
+    assert calls == [assets.observed_vs_predicted(year) for year in ROWS]
@@ -0,0 +1,71 @@
+import pytest
+
+from utils.roi import geometry_hash, normalize_geometry, rectangle_bbox
+
+SQUARE = [[106.1, 11.1], [106.2, 11.1], [106.2, 11.2], [106.1, 11.2], [106.1, 11.1]]
+HOLE = [[106.12, 11.12], [106.14, 11.12], [106.14, 11.14], [106.12, 11.14], [106.12, 11.12]]
+
+
+def polygon(*rings):
+    return {'type': 'Polygon', 'coordinates': [list(ring) for ring in rings]}
+
+
+def rotated(ring, by):
+    open_ring = ring[:-1]
+    open_ring = open_ring[by:] + open_ring[:by]
+    return open_ring + [open_ring[0]]
+
+
+def key(geometry):
+    return geometry_hash(normalize_geometry(geometry))
+
+
+@pytest.mark.parametrize('by', [1, 2, 3])
+def test_start_vertex_does_not_matter(by):
+    assert key(polygon(rotated(SQUARE, by))) == key(polygon(SQUARE))
+
+
+def test_winding_does_not_matter():
+    assert key(polygon(SQUARE[::-1])) == key(polygon(SQUARE))
+    normalized = normalize_geometry(polygon(SQUARE[::-1]))['coordinates'][0]
+    # Exterior rings come out counter-clockwise, closed, from the lowest vertex
+    assert normalized[0] == normalized[-1] == [106.1, 11.1]
+    assert normalized[1] == [106.2, 11.1]
+
+
+def test_rounding_and_number_types():
+    noisy = [[lon + 1e-7, lat - 1e-7] for lon, lat in SQUARE]
+    integers = [[106, 11], [107, 11], [107, 12], [106, 12], [106, 11]]
+    floats = [[float(lon), float(lat)] for lon, lat in integers]
+    assert key(polygon(noisy)) == key(polygon(SQUARE))
+    assert key(polygon(integers)) == key(polygon(floats))
+
+
+def test_holes():
+    with_hole = normalize_geometry(polygon(SQUARE, HOLE[::-1]))
+    assert len(with_hole['coordinates']) == 2
+    # Holes come out clockwise whatever way they were drawn
+    assert with_hole == normalize_geometry(polygon(SQUARE, rotated(HOLE, 2)))
+    assert key(polygon(SQUARE, HOLE)) != key(polygon(SQUARE))
+    # Degenerate holes are dropped
+    assert normalize_geometry(polygon(SQUARE, [[106.13, 11.13]] * 4)) == normalize_geometry(polygon(SQUARE))
+
+
+def test_features_and_multipolygons():
+    feature = {'type': 'Feature', 'properties': {}, 'geometry': polygon(SQUARE)}
+    assert normalize_geometry(feature) == normalize_geometry(polygon(SQUARE))
+    other = [[lon + 1, lat] for lon, lat in SQUARE]
+    first = {'type': 'MultiPolygon', 'coordinates': [[SQUARE], [other]]}
+    second = {'type': 'MultiPolygon', 'coordinates': [[other], [rotated(SQUARE, 1)]]}
+    assert key(first) == key(second)
+    assert normalize_geometry({'type': 'Point', 'coordinates': [106.1, 11.1]}) is None
+    assert normalize_geometry(None) is None
+
+
+def test_rectangles():
+    assert rectangle_bbox(normalize_geometry(polygon(rotated(SQUARE, 2)))) == [106.1, 11.1, 106.2, 11.2]
+    assert rectangle_bbox(normalize_geometry(polygon(SQUARE, HOLE))) is None
+    triangle = [[106.1, 11.1], [106.2, 11.1], [106.1, 11.2], [106.1, 11.1]]
+    assert rectangle_bbox(normalize_geometry(polygon(triangle))) is None
+    tilted = [[106.1, 11.1], [106.2, 11.15], [106.15, 11.25], [106.05, 11.2], [106.1, 11.1]]
+    assert rectangle_bbox(normalize_geometry(polygon(tilted))) is None
@@ -0,0 +1,182 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import cache_codec, disk_cache
+
+
+class FakeRedis:
+    """In-process stand-in for the parts of redis-py RedisCache uses."""
+
+    def __init__(self):
+        self.data = {}  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            entry = None
+        return entry
+
+    def get(self, key):
+        with self.lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, nx=False, ex=None):
+        with self.lock:
+            if nx and self._live(key) is not None:
+                return None
+            self.data[key] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def exists(self, key):
+        with self.lock:
+            return int(self._live(key) is not None)
+
+    def delete(self, key):
+        with self.lock:
+            return int(self.data.pop(key, None) is not None)
+
+    def eval(self, script, numkeys, *args):
+        assert script == disk_cache.RELEASE_LOCK and numkeys == 1
+        name, token = args
+        with self.lock:
+            entry = self._live(name)
+            if entry is not None and entry[0] == token:
+                del self.data[name]
+                return 1
+            return 0
+
+
+@pytest.fixture
+def client():
+    return FakeRedis()
+
+
+@pytest.fixture
+def cache(client):
+    return disk_cache.RedisCache(client, prefix='test:')
+
+
+def test_get_set(cache):
+    assert cache.get('k', ['v1']) == (False, None)
+    cache.set('k', ['v1'], {'mean': 1.5})
+    assert cache.get('k', ['v1']) == (True, {'mean': 1.5})
+
+
+def test_contains(cache):
+    assert not cache.contains('k')
+    cache.set('k', ['v1'], None)
+    assert cache.contains('k')
+
+
+def test_newer_asset_invalidates(cache, client):
+    cache.set('k', ['v1'], 1)
+    assert cache.get('k', ['v2']) == (False, None)
+    assert 'test:k' not in client.data
+
+
+def test_entries_expire(client):
+    cache = disk_cache.RedisCache(client, prefix='test:', ttl=1)
+    cache.set('k', [], 1)
+    assert client.data['test:k'][1] == pytest.approx(time.monotonic() + 1, abs=0.5)
+
+
+def test_lock_is_exclusive(cache, monkeypatch):
+    monkeypatch.setattr(disk_cache, 'LOCK_POLL', 0.01)
+    with cache.lock('k') as first:
+        assert first
+        with cache.lock('k', wait=0.05) as second:
+            assert not second
+    with cache.lock('k', wait=0.05) as again:
+        assert again
+
+
+def test_lock_release_keeps_a_lock_taken_over(cache, client, monkeypatch):
+    monkeypatch.setattr(disk_cache, 'LOCK_POLL', 0.01)
+    with cache.lock('k') as acquired:
+        assert acquired
+        # Our lease ran out and another process took the lock
+        client.set('test:lock:k', b'other')
+    assert client.get('test:lock:k') == b'other'
+
+
+def test_codec_keeps_dtypes():
+    df = pd.DataFrame({
+        'year': np.array([2021, 2022], dtype=np.int16),
+        'agbd': np.array([1.5, np.nan], dtype=np.float32),
+        'count': np.array([3, 4], dtype=np.int64),
+        'name': ['a', 'b'],
+        'valid': [True, False],
+    })
+    value = {'table': df, 'rows': [df.head(1)], 'total': 2.5}
+
+    restored = cache_codec.loads(cache_codec.dumps(value))
+
+    pd.testing.assert_frame_equal(restored['table'], df)
+    assert (restored['table'].dtypes == df.dtypes).all()
+    pd.testing.assert_frame_equal(restored['rows'][0], df.head(1))
+    assert restored['total'] == 2.5
+
+
+def test_codec_falls_back_to_pickle():
+    df = pd.DataFrame({'mixed': [1, 'a', None]})
+    pd.testing.assert_frame_equal(cache_codec.loads(cache_codec.dumps(df)), df)
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(disk_cache, 'LOCK_POLL', 0.01)
+    return disk_cache.DiskCache(str(tmp_path / 'cache.sqlite'))
+
+
+def test_sqlite_lock_is_exclusive(sqlite_cache, tmp_path):
+    # A second instance stands in for another process on the same file
+    other = disk_cache.DiskCache(str(tmp_path / 'cache.sqlite'))
+    with sqlite_cache.lock('k') as first:
+        assert first
+        with other.lock('k', wait=0.05) as second:
+            assert not second
+        with other.lock('other key', wait=0.05) as unrelated:
+            assert unrelated
+    with other.lock('k', wait=0.05) as again:
+        assert again
+
+
+def test_sqlite_lock_lease_expires(sqlite_cache, monkeypatch):
+    monkeypatch.setattr(disk_cache, 'LOCK_LEASE', 0.1)
+    with sqlite_cache.lock('k') as first:
+        assert first
+        # The holder is taken to have crashed once its lease ran out
+        with sqlite_cache.lock('k', wait=1) as second:
+            assert second
+
+
+def test_sqlite_lock_release_keeps_a_lock_taken_over(sqlite_cache, monkeypatch):
+    monkeypatch.setattr(disk_cache, 'LOCK_LEASE', 0.1)
+    taken_over = threading.Event()
+    done = threading.Event()
+
+    def other_process():
+        # Our row keeps its short lease; the other holder's is long
+        monkeypatch.setattr(disk_cache, 'LOCK_LEASE', 300)
+        with sqlite_cache.lock('k', wait=1) as acquired:
+            assert acquired
+            taken_over.set()
+            done.wait(5)
+
+    with sqlite_cache.lock('k') as first:
+        assert first
+        thread = threading.Thread(target=other_process)
+        thread.start()
+        assert taken_over.wait(5)
+    # Releasing our expired lock left the other holder's in place
+    with sqlite_cache.lock('k', wait=0.05) as third:
+        assert not third
+    done.set()
+    thread.join()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from utils.local_rasters import Raster
+from utils.stats_pyramid import StatsPyramid, _bins, points_in_polygon
+
+ROWS, COLS = 100, 120
+# One degree per pixel keeps pixel and lon/lat coordinates easy to relate
+BBOX = [0.0, 0.0, float(COLS), float(ROWS)]
+
+
+@pytest.fixture(scope='module')
+def pyramid():
+    rng = np.random.default_rng(0)
+    data = rng.uniform(0, 400, (ROWS, COLS))
+    data[rng.random((ROWS, COLS)) < 0.1] = np.nan
+    return StatsPyramid(Raster(data, BBOX))
+
+
+def star(rng, points):
+    """Star polygon with random radii: thin spikes and deep notches."""
+    cx, cy = rng.uniform(30, 90), rng.uniform(30, 70)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, points))
+    radii = rng.uniform(2, 45, points)
+    ring = np.column_stack([cx + radii * np.cos(angles), cy + radii * np.sin(angles)])
+    return {'type': 'Polygon', 'coordinates': [np.vstack([ring, ring[:1]]).tolist()]}
+
+
+def brute_force(pyramid, geometry):
+    ring = np.asarray(geometry['coordinates'][0])
+    rows, cols = np.mgrid[0:ROWS, 0:COLS]
+    lon, lat = cols + 0.5, ROWS - (rows + 0.5)
+    pixel_ring = np.column_stack([ring[:, 0], ROWS - ring[:, 1]])
+    inside = points_in_polygon(cols + 0.5, rows + 0.5, [pixel_ring])
+    assert (inside == points_in_polygon(lon, lat, [ring])).all()
+    values = pyramid.raster.data[inside]
+    return values[np.isfinite(values)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_exact_at_zero_tolerance(pyramid, seed):
+    rng = np.random.default_rng(seed)
+    geometry = star(rng, int(rng.integers(3, 40)))
+    values = brute_force(pyramid, geometry)
+
+    stats = pyramid.polygon_stats(geometry, tolerance=0)
+
+    assert stats['count'] == values.size
+    assert stats['uncertain_pixels'] == 0
+    if values.size:
+        assert stats['mean'] == pytest.approx(values.mean())
+        assert stats['min'] == values.min()
+        assert stats['max'] == values.max()
+    bins = _bins(values)
+    assert (stats['hist'] == np.bincount(bins[bins >= 0], minlength=stats['hist'].size)).all()
+
+
+def test_thin_spike_through_a_cell(pyramid):
+    # Both edges cross the top-level cells without a vertex or corner inside them
+    ring = [[1.0, 49.7], [119.0, 49.5], [1.0, 49.3], [1.0, 49.7]]
+    geometry = {'type': 'Polygon', 'coordinates': [ring]}
+
+    assert pyramid.polygon_stats(geometry, tolerance=0)['count'] == brute_force(pyramid, geometry).size
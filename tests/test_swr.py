@@ -0,0 +1,90 @@
+import threading
+import time
+import types
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from utils import disk_cache, ee_executor, swr
+from utils.ee_executor import PAGE_DEADLINE, fan_out
+
+
+class CountingStore(disk_cache.DiskCache):
+    def __init__(self, path):
+        super().__init__(path)
+        self.writes = 0
+        self.reads = 0
+
+    def get(self, key, versions):
+        self.reads += 1
+        return super().get(key, versions)
+
+    def set(self, key, assets, value):
+        self.writes += 1
+        super().set(key, assets, value)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = CountingStore(str(tmp_path / 'last_good.sqlite'))
+    monkeypatch.setattr(swr, '_store', store)
+    monkeypatch.setattr(swr, '_remembered', {})
+    monkeypatch.setattr(swr, '_refreshing', set())
+    return store
+
+
+def done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def test_unchanged_values_are_written_once(store):
+    for _ in range(3):
+        assert swr.resolve(done({'mean': 1.0}), ('stats', 2021)) == ({'mean': 1.0}, None)
+    assert store.writes == 1
+    swr.resolve(done({'mean': 2.0}), ('stats', 2021))
+    assert store.writes == 2
+    assert swr.last_good(('stats', 2021))[0] == {'mean': 2.0}
+
+
+def test_render_deadline(store):
+    assert swr.render_deadline([('stats', 2021)]) == PAGE_DEADLINE
+    swr.remember(('stats', 2021), {'mean': 1.0})
+    assert swr.render_deadline([('stats', 2021)]) == swr.STALE_WAIT
+    assert swr.render_deadline([('stats', 2021), ('hist', 2021)]) == PAGE_DEADLINE
+    # Only existence is checked; no value is loaded
+    assert store.reads == 0
+
+
+def test_falls_back_while_running(store):
+    swr.remember(('stats', 2021), {'mean': 1.0})
+    running = Future()
+    value, as_of = swr.resolve(running, ('stats', 2021))
+    assert value == {'mean': 1.0} and as_of is not None
+    running.set_result({'mean': 2.0})
+    assert swr.last_good(('stats', 2021))[0] == {'mean': 2.0}
+
+
+def test_refresh_survives_a_newer_rerun(store, monkeypatch):
+    monkeypatch.setattr(ee_executor, 'st', types.SimpleNamespace(session_state={}))
+    # A saturated pool: the calls below stay queued
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(ee_executor, '_executor', pool)
+    release = threading.Event()
+    pool.submit(release.wait)
+    swr.remember(('stats', 2021), {'mean': 1.0})
+
+    first = fan_out({'stats': lambda: {'mean': 2.0}, 'other': lambda: 'other'}, page='map', deadline=0.05)
+    assert swr.resolve(first['stats'], ('stats', 2021))[0] == {'mean': 1.0}
+    fan_out({}, page='map', deadline=0)
+    release.set()
+
+    # The call without a refresh was cancelled, the refresh was not
+    assert first['other'].cancelled()
+    assert first['stats'].result(timeout=5) == {'mean': 2.0}
+    deadline = time.monotonic() + 5
+    while swr.last_good(('stats', 2021))[0] != {'mean': 2.0}:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    pool.shutdown()
@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import tile_proxy
+
+
+class _Origin(BaseHTTPRequestHandler):
+    """Stands in for Earth Engine's tile server."""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith('/fail/'):
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = f'png {self.path}'.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Origin)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def proxy(origin, tmp_path, monkeypatch):
+    monkeypatch.setattr(tile_proxy, 'asset_update_times', lambda asset_ids: ['v1' for _ in asset_ids])
+    base = f'http://127.0.0.1:{origin.server_port}'
+
+    def resolve(asset_id, vis_params):
+        return f'{base}/{asset_id}/{vis_params["palette"]}/{{z}}/{{x}}/{{y}}'
+
+    proxy = tile_proxy.TileProxy(resolve, str(tmp_path))
+    server = tile_proxy.serve(proxy, '127.0.0.1', 0)
+    proxy.base_url = f'http://127.0.0.1:{server.server_port}'
+    yield proxy
+    server.shutdown()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, b''
+
+
+def tile(proxy, asset_id, palette, z, x, y):
+    template = proxy.layer_url(asset_id, {'palette': palette}, proxy.base_url)
+    return get(template.format(z=z, x=x, y=y))
+
+
+def test_miss_then_hit(proxy, origin):
+    status, headers, body = tile(proxy, 'agb', 'green', 3, 1, 2)
+    assert status == 200
+    assert body == b'png /agb/green/3/1/2'
+    assert 'immutable' in headers['Cache-Control']
+    assert headers['Content-Type'] == 'image/png'
+
+    assert tile(proxy, 'agb', 'green', 3, 1, 2)[2] == body
+    assert len(origin.requests) == 1
+    stats = json.loads(get(f'{proxy.base_url}/stats')[2])
+    assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+
+
+def test_layers_do_not_mix(proxy, origin):
+    assert tile(proxy, 'agb', 'green', 3, 1, 2)[2] == b'png /agb/green/3/1/2'
+    assert tile(proxy, 'agb', 'red', 3, 1, 2)[2] == b'png /agb/red/3/1/2'
+    assert len(origin.requests) == 2
+
+
+def test_upstream_errors_are_not_cached(proxy, origin):
+    status, headers, _ = tile(proxy, 'fail', 'green', 1, 0, 0)
+    assert status == 502
+    assert headers['Cache-Control'] == 'no-store'
+    assert tile(proxy, 'fail', 'green', 1, 0, 0)[0] == 502
+    assert len(origin.requests) == 2
+    assert proxy.stats()['errors'] == 2
+
+
+def test_unknown_layer(proxy):
+    assert get(f'{proxy.base_url}/tiles/0123456789abcdef/1/0/0')[0] == 404
+    assert get(f'{proxy.base_url}/tiles/../1/0/0')[0] == 404
+
+
+def test_old_tiles_are_evicted(origin, tmp_path):
+    base = f'http://127.0.0.1:{origin.server_port}'
+    proxy = tile_proxy.TileProxy(lambda asset_id, vis: f'{base}/{asset_id}/{{z}}/{{x}}/{{y}}', str(tmp_path),
+                                 max_bytes=200)
+    layer = proxy.register('agb', {}, 'v1')
+    for x in range(20):
+        assert proxy.tile(layer, 5, x, 0)[0] == 200
+        time.sleep(0.01)  # distinct modification times
+
+    sizes = [os.path.getsize(os.path.join(root, name))
+             for root, _, files in os.walk(str(tmp_path)) for name in files if name.endswith('.png')]
+    assert sum(sizes) <= 200
+    assert proxy.stats()['evicted'] > 0
+    # The newest tiles stay; the oldest are fetched again
+    assert proxy.tile(layer, 5, 19, 0)[0] == 200 and proxy.stats()['hits'] == 1
+    assert proxy.tile(layer, 5, 0, 0)[0] == 200 and proxy.stats()['misses'] == 21
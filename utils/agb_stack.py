@@ -0,0 +1,58 @@
+import ee
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils import assets
+from utils.disk_cache import persistent_cache
+from utils.ee_client import get_info
+from utils.regions import DEFAULT_REGION, REGIONS, reduction_geometry
+
+
+class AGBStack:
+    """Every yearly AGB raster as one multi-band image (agbd_2021, agbd_2022, ...).
+
+    Reducing the stack once answers a question for all years in a single
+    request instead of one request per year.
+    """
+
+    def __init__(self, years=assets.YEARS):
+        self.years = list(years)
+        self.bands = [f'agbd_{year}' for year in self.years]
+        self.image = ee.Image.cat([
+            ee.Image(assets.agb(year)).select('agbd').rename(band)
+            for year, band in zip(self.years, self.bands)
+        ])
+
+    def asset_ids(self):
+        return [assets.agb(year) for year in self.years]
+
+    def stats_query(self, geometry, scale=100):
+        # A single-input reducer is repeated per band: agbd_2021_mean, ...
+        reducer = ee.Reducer.mean().combine(
+            ee.Reducer.min(), '', True
+        ).combine(
+            ee.Reducer.max(), '', True
+        ).combine(
+            ee.Reducer.stdDev(), '', True
+        )
+        return self.image.reduceRegion(reducer=reducer, geometry=geometry, scale=scale, maxPixels=1e10)
+
+    def parse_stats(self, result):
+        """One row per year from the result of stats_query."""
+        result = result or {}
+        return pd.DataFrame({
+            'year': np.asarray(self.years, dtype=np.int16),
+            'mean': np.asarray([result.get(f'{band}_mean') for band in self.bands], dtype=np.float64),
+            'min': np.asarray([result.get(f'{band}_min') for band in self.bands], dtype=np.float64),
+            'max': np.asarray([result.get(f'{band}_max') for band in self.bands], dtype=np.float64),
+            'stddev': np.asarray([result.get(f'{band}_stdDev') for band in self.bands], dtype=np.float64),
+        })
+
+
+@st.cache_data
+@persistent_cache(lambda region=DEFAULT_REGION: AGBStack().asset_ids() + [REGIONS[region]])
+def fetch_yearly_summary(region=DEFAULT_REGION):
+    """Mean, min, max and std. deviation of AGB for every year in one request."""
+    stack = AGBStack()
+    return stack.parse_stats(get_info(stack.stats_query(reduction_geometry(region))))
@@ -0,0 +1,18 @@
+# Earth Engine asset IDs used by the dashboard
+ASSET_ROOT = 'projects/seventh-program-460820-u1/assets'
+
+CAT_TIEN_BOUNDARY = f'{ASSET_ROOT}/Cat_tien_ranh_gioi'
+AGBP_PER_YEAR = f'{ASSET_ROOT}/Cattien/AGBP_per_year'
+AGBP_DIFF_PER_YEAR = f'{ASSET_ROOT}/Cattien/AGBP_Diff_per_year'
+RMSE_PER_YEAR = f'{ASSET_ROOT}/Cattien/RMSE_per_year'
+AGB_TREND = f'{ASSET_ROOT}/Cattien/gedi_trend_2021_2024'
+
+YEARS = [2021, 2022, 2023, 2024]
+
+
+def agb(year):
+    return f'{ASSET_ROOT}/Cattien/agb_{year}'
+
+
+def observed_vs_predicted(year):
+    return f'{ASSET_ROOT}/Cattien/Observed_vs_Predicted_{year}'
@@ -0,0 +1,149 @@
+"""Where the dashboard's raster numbers come from.
+
+EEBackend asks Earth Engine. LocalBackend computes the same values with
+NumPy from rasters on disk (see utils.local_rasters), so once they exist
+these statistics use no Earth Engine quota and can be tested offline.
+Missing rasters are downloaded once with computePixels (see utils.pixels).
+Pick one with BIOMASS_BACKEND=ee|local. The app still signs in to Earth
+Engine either way: the summary tables, map tiles and region boundary come
+from there.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils import assets
+from utils.agb_stack import fetch_yearly_summary
+from utils.dashboard_data import HIST_BIN, HIST_MAX, HIST_MIN, fetch_agb_histogram
+from utils.local_rasters import RASTER_DIR
+from utils.pixels import ensure_raster
+from utils.point_inspector import point_series
+from utils.roi import fetch_roi_stats, geometry_hash, rectangle_bbox
+from utils.sat import open_sat
+from utils.stats_pyramid import open_pyramid
+from utils.region_stats import CLASS_COUNT, CLASS_LABELS, CLASS_WIDTH, PERCENTILES, fetch_region_stats
+from utils.regions import DEFAULT_REGION
+
+BACKEND = os.environ.get('BIOMASS_BACKEND', 'ee')
+
+
+class EEBackend:
+    name = 'ee'
+
+    def region_stats(self, year, region=DEFAULT_REGION):
+        return fetch_region_stats(year, region)
+
+    def histogram(self, year):
+        return fetch_agb_histogram(year)
+
+    def yearly_summary(self):
+        return fetch_yearly_summary()
+
+    def roi_stats(self, year, geometry):
+        """Statistics inside a normalized drawn geometry (see utils.roi)."""
+        return fetch_roi_stats(year, geometry_hash(geometry), geometry)
+
+    def point_series(self, lon, lat):
+        """AGB of every year and the trend at a point, in one request per pixel."""
+        return point_series(lon, lat)
+
+
+def _values(raster):
+    """Valid pixel values and the area of each one, in ha."""
+    data = np.asarray(raster.data)
+    valid = np.isfinite(data)
+    area = np.broadcast_to(raster.row_area_ha()[:, None], data.shape)
+    return data[valid], area[valid]
+
+
+def raster_region_stats(raster):
+    """Same numbers as region_stats_query, from a local raster."""
+    values, area = _values(raster)
+    if values.size == 0:
+        return None
+    classes = np.clip(values // CLASS_WIDTH, 0, CLASS_COUNT - 1).astype(np.intp)
+    stats = {
+        'mean': float(values.mean()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'stddev': float(values.std()),
+        'class_areas': pd.DataFrame({
+            'class': CLASS_LABELS,
+            'area_ha': np.bincount(classes, weights=area, minlength=CLASS_COUNT),
+        }),
+    }
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats[f'p{p}'] = float(value)
+    return stats
+
+
+def raster_histogram(raster):
+    values, _ = _values(raster)
+    counts, edges = np.histogram(values, bins=np.arange(HIST_MIN, HIST_MAX + HIST_BIN, HIST_BIN))
+    return pd.DataFrame({
+        'bin_start': edges[:-1].astype(np.float32),
+        'count': counts.astype(np.float64),
+    })
+
+
+class LocalBackend:
+    name = 'local'
+
+    def __init__(self, directory=RASTER_DIR, download_missing=True):
+        self.directory = directory
+        self.download_missing = download_missing
+
+    def _raster(self, year):
+        # Same rule as the SAT and pyramid: downloaded rasters follow their
+        # asset, hand exports are kept
+        raster = ensure_raster(year, self.directory, self.download_missing)
+        if raster is None:
+            raise FileNotFoundError(f"No local AGB raster for {year} in {self.directory}")
+        return raster
+
+    def region_stats(self, year, region=DEFAULT_REGION):
+        # Exported rasters are already clipped to the region boundary
+        return raster_region_stats(self._raster(year))
+
+    def histogram(self, year):
+        return raster_histogram(self._raster(year))
+
+    def yearly_summary(self):
+        rows = [raster_region_stats(self._raster(year)) or {} for year in assets.YEARS]
+        return pd.DataFrame({
+            'year': np.asarray(assets.YEARS, dtype=np.int16),
+            **{key: np.asarray([row.get(key) for row in rows], dtype=np.float64)
+               for key in ['mean', 'min', 'max', 'stddev']},
+        })
+
+    def roi_stats(self, year, geometry):
+        stats = open_pyramid(year, self.directory, self.download_missing).polygon_stats(geometry)
+        if not stats['count']:
+            return None
+        bbox = rectangle_bbox(geometry)
+        return {
+            **{key: stats[key] for key in ['mean', 'min', 'max', 'stddev', 'count']},
+            # Exact totals come for free from the summed-area table on rectangles
+            'total_t': open_sat(year, self.directory, self.download_missing).rect_stats(bbox)['total_t'] if bbox else None,
+        }
+
+    def point_series(self, lon, lat):
+        # The trend is only available from Earth Engine
+        values = {}
+        for year in assets.YEARS:
+            raster = self._raster(year)
+            index = raster.pixel_index(lon, lat)
+            value = float(raster.data[index]) if index is not None else np.nan
+            values[year] = None if np.isnan(value) else value
+        return {'agbd': values, 'trend': None}
+
+
+@st.cache_resource
+def get_backend(name=BACKEND):
+    if name == 'local':
+        return LocalBackend()
+    if name == 'ee':
+        return EEBackend()
+    raise ValueError(f"Unknown data backend: {name}")
@@ -0,0 +1,45 @@
+"""Serialization of cached values.
+
+Values are pickled, except that every DataFrame inside them (also inside
+dicts and lists) is written as an Arrow IPC stream: columnar, compact, and
+it keeps the NumPy dtypes the loaders choose. pyarrow already comes with
+Streamlit. Blobs written with plain pickle still load.
+"""
+import io
+import pickle
+
+import pandas as pd
+import pyarrow as pa
+
+
+def _dataframe_from_arrow(buffer):
+    return pa.ipc.open_stream(buffer).read_pandas()
+
+
+def _dataframe_to_arrow(df):
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class _Pickler(pickle.Pickler):
+    def reducer_override(self, obj):
+        if type(obj) is pd.DataFrame:
+            try:
+                return _dataframe_from_arrow, (_dataframe_to_arrow(obj),)
+            except (pa.ArrowException, TypeError, ValueError):
+                # e.g. object columns of mixed types: plain pickle instead
+                pass
+        return NotImplemented
+
+
+def dumps(value):
+    buffer = io.BytesIO()
+    _Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(value)
+    return buffer.getvalue()
+
+
+def loads(blob):
+    return pickle.loads(blob)
@@ -0,0 +1,84 @@
+"""Fill the caches in the background right after startup.
+
+Without it, the first visitor of each year after a deploy pays for that
+year's statistics, histogram and map IDs.
+With BIOMASS_WARM_CACHE=1 the app starts one warmer per process once
+Earth Engine authentication succeeds. It calls the same cached functions
+the pages call, for every year, region and palette, at BACKGROUND
+priority (see utils.ee_client) and with only WARM_WORKERS at a time, so
+visitors are served first. Progress and the total time go to the log.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import streamlit as st
+
+from page.home import AGB_VIS_PARAMS, TREND_VIS_PARAMS
+from page.map import PALETTES, agb_vis_params
+from utils import assets
+from utils.backends import get_backend
+from utils.dashboard_data import fetch_dashboard_data
+from utils.ee_client import BACKGROUND, priority
+from utils.map_tiles import tile_url
+from utils.regions import REGIONS, get_region
+
+WARM_CACHE = os.environ.get('BIOMASS_WARM_CACHE', '') not in ('', '0')
+WARM_WORKERS = int(os.environ.get('BIOMASS_WARM_WORKERS', '2'))
+
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+
+def warm_tasks(backend):
+    """(name, callable) for everything a cold page would compute."""
+    tasks = [('yearly summary', backend.yearly_summary)]
+    tasks += [(f'region info {region}', lambda region=region: get_region(region)) for region in REGIONS]
+    tasks.append(('trend map ID', lambda: tile_url(assets.AGB_TREND, TREND_VIS_PARAMS)))
+    for year in assets.YEARS:
+        tasks += [
+            (f'dashboard data {year}', lambda year=year: fetch_dashboard_data(year)),
+            (f'histogram {year}', lambda year=year: backend.histogram(year)),
+            (f'home map ID {year}', lambda year=year: tile_url(assets.agb(year), AGB_VIS_PARAMS)),
+        ]
+        tasks += [(f'region stats {region} {year}', lambda year=year, region=region: backend.region_stats(year, region))
+                  for region in REGIONS]
+        tasks += [(f'map ID {name} {year}', lambda year=year, palette=palette: tile_url(assets.agb(year), agb_vis_params(palette)))
+                  for name, palette in PALETTES.items()]
+    return tasks
+
+
+def _run(task):
+    name, fn = task
+    with priority(BACKGROUND):
+        fn()
+    return name
+
+
+def warm(backend, workers=WARM_WORKERS):
+    tasks = warm_tasks(backend)
+    started = time.monotonic()
+    failed = 0
+    logger.info("Cache warmer: %d tasks, %d workers", len(tasks), workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warmer") as pool:
+        futures = {pool.submit(_run, task): task[0] for task in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+                logger.info("Cache warmer: %d/%d %s", done, len(tasks), futures[future])
+            except Exception as e:
+                failed += 1
+                logger.warning("Cache warmer: %d/%d %s failed: %s", done, len(tasks), futures[future], e)
+    logger.info("Cache warmer: finished in %.1f s (%d failed)", time.monotonic() - started, failed)
+
+
+@st.cache_resource
+def start_warmer():
+    """Start warming once per process; later calls return the same thread."""
+    thread = threading.Thread(target=warm, args=(get_backend(),), name="cache-warmer", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,153 @@
+import math
+
+import ee
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils import assets
+from utils.disk_cache import persistent_cache
+from utils.ee_client import get_info
+from utils.regions import reduction_target
+
+# name -> (asset, columns) for the per-year summary tables
+TABLES = {
+    'agbp': (assets.AGBP_PER_YEAR, ['year', 'total_agb']),
+    'agbp_diff': (assets.AGBP_DIFF_PER_YEAR, ['year', 'change']),
+    'rmse': (assets.RMSE_PER_YEAR, ['year', 'rmse']),
+}
+# Compact dtypes for known columns; totals keep float64 for precision
+COLUMN_DTYPES = {
+    'year': np.int16,
+    'agbd': np.float32,
+    'agbd_predicted': np.float32,
+    'rmse': np.float32,
+    'total_agb': np.float64,
+    'change': np.float64,
+}
+
+
+def table_rows(collection, columns):
+    """Server-side list of [col1, col2, ...] rows, one per feature.
+
+    Only the named properties are sent back, no geometries.
+    """
+    return collection.reduceColumns(ee.Reducer.toList(len(columns)), columns).get('list')
+
+
+def _is_int(column):
+    dtype = COLUMN_DTYPES.get(column)
+    return dtype is not None and np.issubdtype(dtype, np.integer)
+
+
+def _is_float(column):
+    dtype = COLUMN_DTYPES.get(column)
+    return dtype is not None and np.issubdtype(dtype, np.floating)
+
+
+def rows_to_df(rows, columns):
+    """Build a DataFrame column by column with NumPy arrays of compact dtype.
+
+    Nulls in float columns become NaN. Rows with a null in an integer column
+    (e.g. a feature without a year) are dropped, as they cannot be plotted.
+    """
+    int_columns = [i for i, column in enumerate(columns) if _is_int(column)]
+    rows = [row for row in rows or [] if all(row[i] is not None for i in int_columns)]
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return pd.DataFrame({
+        column: np.asarray([np.nan if v is None else v for v in column_values] if _is_float(column)
+                           else column_values, dtype=COLUMN_DTYPES.get(column))
+        for column, column_values in zip(columns, values)
+    })
+
+
+# Histogram bins in t/ha: 10 t/ha wide over 0-300
+HIST_MIN, HIST_MAX, HIST_BIN = 0, 300, 10
+
+
+def histogram_query(year):
+    """Pixel counts per AGB bin over every pixel in the boundary."""
+    image, geometry = reduction_target(ee.Image(assets.agb(year)).select('agbd'))
+    bins = (HIST_MAX - HIST_MIN) // HIST_BIN
+    return image.reduceRegion(
+        reducer=ee.Reducer.fixedHistogram(HIST_MIN, HIST_MAX, bins),
+        geometry=geometry,
+        scale=100,
+        maxPixels=1e10
+    ).get('agbd')
+
+
+def model_metrics_query(year):
+    """RMSE, MAE, bias and R² inputs for one year, in a single reducer pass."""
+    fc = ee.FeatureCollection(assets.observed_vs_predicted(year)).filter(
+        ee.Filter.notNull(['agbd', 'agbd_predicted']))
+
+    def add_errors(f):
+        error = ee.Number(f.get('agbd_predicted')).subtract(f.get('agbd'))
+        return f.set({'error': error, 'abs_error': error.abs(), 'sq_error': error.pow(2)})
+
+    # mean -> [MSE, MAE, bias, mean observed]; variance and count of observed
+    reducer = ee.Reducer.mean().repeat(4).combine(
+        ee.Reducer.variance(), '', False
+    ).combine(
+        ee.Reducer.count(), '', False
+    )
+    return fc.map(add_errors).reduceColumns(
+        reducer, ['sq_error', 'abs_error', 'error', 'agbd', 'agbd', 'agbd'])
+
+
+def parse_model_metrics(result):
+    if not result or not result.get('count'):
+        return None
+    mse, mae, bias, mean_observed = result['mean']
+    variance = result.get('variance')
+    return {
+        'rmse': math.sqrt(mse),
+        'mae': mae,
+        'bias': bias,
+        'r2': 1 - mse / variance if variance else None,
+        'mean_observed': mean_observed,
+        'count': result['count'],
+    }
+
+
+def dashboard_query(year):
+    """Per-year tables and model metrics as a single ee.Dictionary."""
+    query = {name: table_rows(ee.FeatureCollection(asset_id), columns)
+             for name, (asset_id, columns) in TABLES.items()}
+    query['metrics'] = model_metrics_query(year)
+    return ee.Dictionary(query)
+
+
+def split_result(result):
+    """Turn the evaluated dictionary back into DataFrames and plain values."""
+    data = {name: rows_to_df(result.get(name), columns) for name, (_, columns) in TABLES.items()}
+    data['metrics'] = parse_model_metrics(result.get('metrics'))
+    return data
+
+
+def dashboard_assets(year):
+    return [asset_id for asset_id, _ in TABLES.values()] + [assets.observed_vs_predicted(year)]
+
+
+@st.cache_data
+@persistent_cache(dashboard_assets)
+def fetch_dashboard_data(year: int):
+    """Fetch all per-year dashboard data in one Earth Engine round trip."""
+    return split_result(get_info(dashboard_query(year)))
+
+
+@st.cache_data
+@persistent_cache(lambda year: [assets.agb(year), assets.CAT_TIEN_BOUNDARY])
+def fetch_agb_histogram(year: int):
+    """Bin counts of the AGB histogram for one year, as a DataFrame."""
+    # fixedHistogram returns [[bin_start, count], ...]; edge pixels count fractionally
+    rows = get_info(histogram_query(year))
+    return pd.DataFrame({
+        'bin_start': np.asarray([row[0] for row in rows or []], dtype=np.float32),
+        'count': np.asarray([row[1] for row in rows or []], dtype=np.float64),
+    })
+
+
+def empty_dashboard_data():
+    return split_result({})
@@ -0,0 +1,373 @@
+"""Persistent cache shared by all Streamlit processes.
+
+st.cache_data is per process, so every replica behind the load balancer
+would repeat each Earth Engine call. persistent_cache puts a shared store
+under it, chosen with BIOMASS_CACHE_BACKEND:
+
+    sqlite  SQLite in WAL mode under BIOMASS_CACHE_DIR (default); put the
+            directory on a volume the replicas share
+    redis   any Redis-compatible server at BIOMASS_REDIS_URL
+
+Both drop entries built from older asset versions and hold a
+cross-process lock while a missing entry is filled, so only one process
+computes it and the others read the result. A stored entry is served
+without waiting for Earth Engine: the asset versions are checked in the
+background and an outdated entry is dropped for the next call.
+"""
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+
+from utils import cache_codec
+from utils.ee_client import BACKGROUND, get_asset, keep_priority, priority
+
+CACHE_DIR = os.environ.get('BIOMASS_CACHE_DIR', '.cache')
+MAX_BYTES = int(float(os.environ.get('BIOMASS_CACHE_MAX_MB', '512')) * 1024 * 1024)
+CACHE_BACKEND = os.environ.get('BIOMASS_CACHE_BACKEND', 'sqlite')
+REDIS_URL = os.environ.get('BIOMASS_REDIS_URL', 'redis://localhost:6379/0')
+# Redis evicts by its own maxmemory policy; entries also expire after this
+REDIS_TTL = int(os.environ.get('BIOMASS_CACHE_TTL_DAYS', '30')) * 24 * 3600
+# A fill holds its lock at most this long, so a crashed process cannot block others
+LOCK_LEASE = 300  # seconds
+LOCK_WAIT = 120  # seconds to wait for another process's fill before computing anyway
+LOCK_POLL = 0.25
+# How long an asset's updateTime is trusted before asking Earth Engine again
+ASSET_CHECK_TTL = 600  # seconds
+
+_stats = {'hits': 0, 'misses': 0, 'invalidated': 0, 'evicted': 0}
+_stats_lock = threading.Lock()
+_update_times = {}  # asset_id -> (checked_at, updateTime)
+_lookup_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ee-asset")
+# Separate from _lookup_pool, whose map the checks themselves use
+_revalidate_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-revalidate")
+_revalidating = set()  # cache keys with a check in flight
+_revalidating_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def cache_stats():
+    """Hit/miss counters for this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _fetch_update_time(asset_id):
+    try:
+        update_time = get_asset(asset_id).get('updateTime')
+    except Exception:
+        # Offline or not allowed to read metadata: keep serving what we have,
+        # and do not ask again before ASSET_CHECK_TTL
+        cached = _update_times.get(asset_id)
+        update_time = cached[1] if cached else None
+    _update_times[asset_id] = (time.time(), update_time)
+    return update_time
+
+
+def _unchecked(asset_ids):
+    now = time.time()
+    return [a for a in asset_ids
+            if a not in _update_times or now - _update_times[a][0] > ASSET_CHECK_TTL]
+
+
+def known_update_times(asset_ids):
+    """Last updateTime seen for each asset, None if never checked; never waits."""
+    return [_update_times[a][1] if a in _update_times else None for a in asset_ids]
+
+
+def asset_update_times(asset_ids):
+    """updateTime for each asset, looked up in parallel when not recently checked."""
+    stale = _unchecked(asset_ids)
+    fetched = dict(zip(stale, _lookup_pool.map(keep_priority(_fetch_update_time), stale)))
+    return [fetched[a] if a in fetched else _update_times[a][1] for a in asset_ids]
+
+
+def _outdated(versions, stored):
+    # A version of None means the lookup failed, which never invalidates
+    return any(new is not None and new != old for new, old in zip(versions, stored))
+
+
+def _wait_for_lock(try_acquire, wait):
+    end = time.monotonic() + wait
+    while not try_acquire():
+        if time.monotonic() >= end:
+            return False
+        time.sleep(LOCK_POLL)
+    return True
+
+
+class DiskCache:
+    """SQLite-backed key/value store with least-recently-used eviction.
+
+    WAL mode lets every process read while one writes. It needs the
+    processes on one host (WAL does not work over network file systems).
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, versions TEXT, value BLOB,"
+                " size INTEGER, accessed REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT, expires REAL)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key, versions):
+        """Return (found, value); entries built from older asset versions are dropped."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT versions, value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+            if _outdated(versions, json.loads(row[0])):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                _count('invalidated')
+                return False, None
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        try:
+            return True, cache_codec.loads(row[1])
+        except Exception:
+            # Written by an incompatible version of the app: recompute
+            return False, None
+
+    def contains(self, key):
+        """Whether an entry exists, without reading or checking it."""
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    @contextlib.contextmanager
+    def lock(self, key, wait=LOCK_WAIT):
+        """Hold a cross-process lock on key; yields False if it could not be had in time."""
+        token = uuid.uuid4().hex
+
+        def try_acquire():
+            with self._connect() as conn:
+                now = time.time()
+                conn.execute("DELETE FROM locks WHERE key = ? AND expires < ?", (key, now))
+                return conn.execute("INSERT OR IGNORE INTO locks VALUES (?, ?, ?)",
+                                    (key, token, now + LOCK_LEASE)).rowcount == 1
+
+        acquired = _wait_for_lock(try_acquire, wait)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+    def set(self, key, versions, value):
+        blob = cache_codec.dumps(value)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(versions), blob, len(blob), time.time()),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            _count('evicted')
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+# Deletes the lock only while it still holds our token, in one step
+RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCache:
+    """The same store on a Redis-compatible server.
+
+    `client` is anything with redis-py's get/set/delete/exists/eval, e.g. a local
+    stand-in; by default one is connected to BIOMASS_REDIS_URL.
+    """
+
+    def __init__(self, client=None, url=REDIS_URL, prefix='biomass:', ttl=REDIS_TTL):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key, versions):
+        blob = self.client.get(self.prefix + key)
+        if blob is None:
+            return False, None
+        try:
+            stored, value = cache_codec.loads(blob)
+        except Exception:
+            return False, None
+        if _outdated(versions, stored):
+            self.client.delete(self.prefix + key)
+            _count('invalidated')
+            return False, None
+        return True, value
+
+    def contains(self, key):
+        return bool(self.client.exists(self.prefix + key))
+
+    def set(self, key, versions, value):
+        self.client.set(self.prefix + key, cache_codec.dumps((versions, value)), ex=self.ttl)
+
+    @contextlib.contextmanager
+    def lock(self, key, wait=LOCK_WAIT):
+        name = f'{self.prefix}lock:{key}'
+        token = uuid.uuid4().hex.encode()
+        acquired = _wait_for_lock(lambda: bool(self.client.set(name, token, nx=True, ex=LOCK_LEASE)), wait)
+        try:
+            yield acquired
+        finally:
+            # Only release our own lock, not one taken over after the lease ran out
+            if acquired:
+                self.client.eval(RELEASE_LOCK, 1, name, token)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if CACHE_BACKEND == 'redis':
+                _cache = RedisCache()
+            elif CACHE_BACKEND == 'sqlite':
+                _cache = DiskCache(os.path.join(CACHE_DIR, 'ee_results.sqlite'))
+            else:
+                raise ValueError(f"Unknown cache backend: {CACHE_BACKEND}")
+        return _cache
+
+
+# ee functions that read an asset, and the argument holding its ID
+_LOAD_FUNCTIONS = {
+    'Collection.loadTable': 'tableId',
+    'Image.load': 'id',
+    'ImageCollection.load': 'id',
+}
+
+
+def _find_assets(node, found):
+    if isinstance(node, dict):
+        arg = _LOAD_FUNCTIONS.get(node.get('functionName'))
+        if arg is not None:
+            asset_id = node.get('arguments', {}).get(arg, {}).get('constantValue')
+            if isinstance(asset_id, str) and asset_id not in found:
+                found.append(asset_id)
+        for value in node.values():
+            _find_assets(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _find_assets(value, found)
+
+
+def referenced_assets(obj):
+    """Asset IDs loaded anywhere in an ee expression."""
+    found = []
+    _find_assets(json.loads(obj.serialize()), found)
+    return found
+
+
+def expression_key(obj):
+    """Stable hash of an ee expression, usable as a cache key."""
+    return hashlib.sha256(obj.serialize().encode()).hexdigest()
+
+
+def _key_part(value):
+    if isinstance(value, ee.ComputedObject):
+        return expression_key(value)
+    return repr(value)
+
+
+def make_key(name, asset_ids, *parts):
+    payload = json.dumps([name, asset_ids, *parts], sort_keys=True, default=_key_part)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _revalidate(cache, key, asset_ids):
+    """Check the entry's assets in the background; get() drops it if one changed."""
+    with _revalidating_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+
+    def check():
+        try:
+            with priority(BACKGROUND):
+                cache.get(key, asset_update_times(asset_ids))
+        finally:
+            with _revalidating_lock:
+                _revalidating.discard(key)
+
+    _revalidate_pool.submit(check)
+
+
+def persistent_cache(assets, should_store=lambda value: value is not None):
+    """Cache a function's result on disk, keyed by its arguments and the assets it reads.
+
+    `assets` is called with the same arguments and returns the asset IDs the
+    result depends on; an entry is dropped as soon as one of them is updated.
+    Results rejected by `should_store` (e.g. placeholders returned after an
+    error) are passed through without being saved.
+    """
+    def decorator(fn):
+        name = f'{fn.__module__}.{fn.__qualname__}'
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            asset_ids = list(assets(*args, **kwargs))
+            key = make_key(name, asset_ids, args, kwargs)
+            cache = get_cache()
+            found, value = cache.get(key, known_update_times(asset_ids))
+            if found:
+                _count('hits')
+                if _unchecked(asset_ids):
+                    _revalidate(cache, key, asset_ids)
+                return value
+            # A miss goes to Earth Engine anyway: store the current versions
+            versions = asset_update_times(asset_ids)
+            # One process fills the entry; the others wait for it and read it
+            with cache.lock(key):
+                found, value = cache.get(key, versions)
+                if found:
+                    _count('hits')
+                    return value
+                _count('misses')
+                value = fn(*args, **kwargs)
+                if should_store(value):
+                    cache.set(key, versions, value)
+            return value
+        return wrapper
+    return decorator
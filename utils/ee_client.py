@@ -0,0 +1,276 @@
+"""Every Earth Engine request of the app goes through here.
+
+Streamlit caches do not share work that is still running: when several
+sessions miss the cache together, each would send the same request. Calls
+are therefore coalesced process-wide ("single flight"): while a request
+for a key is in flight, identical requests wait for its result instead of
+sending their own.
+
+Requests that do go out pass through one scheduler. It caps how many run
+at once, spaces them with a token bucket sized to the project's quota,
+retries throttling and transient server errors with exponential backoff
+and jitter, and lets interactive work overtake background work (see
+`priority`). An interactive caller that joins a queued background request
+raises that request to its own priority instead of waiting behind it.
+"""
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import ee
+
+MAX_CONCURRENT = int(os.environ.get('BIOMASS_EE_MAX_CONCURRENT', '8'))
+REQUESTS_PER_SECOND = float(os.environ.get('BIOMASS_EE_QPS', '10'))
+BURST = max(1, int(os.environ.get('BIOMASS_EE_BURST', '20')))
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # seconds, doubled after every retry
+BACKOFF_MAX = 30
+
+# Lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# EEException carries only a message, e.g. "Too Many Requests: ..."
+RETRYABLE_MESSAGES = ['too many requests', 'quota exceeded', 'rate limit',
+                      'service unavailable', 'backend error', 'internal error']
+
+_inflight = {}  # key -> (Future, _Ticket) of the request being made
+_lock = threading.Lock()
+_stats = {'requests': 0, 'upstream': 0, 'coalesced': 0}
+_priority = contextvars.ContextVar('ee_priority', default=INTERACTIVE)
+# Ticket of the single-flight request the current thread is leading
+_leading = contextvars.ContextVar('ee_leading', default=None)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Run the Earth Engine calls made inside the block at another priority."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def keep_priority(fn):
+    """fn running at the caller's priority, also when a worker thread calls it.
+
+    Threads do not inherit context variables, so work handed to a pool
+    would otherwise run at INTERACTIVE priority.
+    """
+    level = _priority.get()
+
+    def run(*args, **kwargs):
+        with priority(level):
+            return fn(*args, **kwargs)
+    return run
+
+
+def is_retryable(error):
+    """Throttling, transient server errors and dropped connections."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # googleapiclient.errors.HttpError keeps the response
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        return int(status) in RETRYABLE_STATUS
+    message = str(error).lower()
+    return any(marker in message for marker in RETRYABLE_MESSAGES)
+
+
+class _Ticket:
+    """A request's place in the scheduler queue; callers joining it can raise its priority."""
+
+    def __init__(self, level):
+        self.level = level
+        self.scheduler = None
+        self.queued = None  # heap entry while waiting for a slot
+
+    def raise_to(self, level):
+        if level >= self.level:
+            return
+        self.level = level
+        scheduler = self.scheduler
+        if scheduler is not None:
+            scheduler._requeue(self)
+
+
+class Scheduler:
+    """Concurrency cap + token bucket + priority queue + retry with backoff."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, rate=REQUESTS_PER_SECOND, burst=BURST,
+                 max_retries=MAX_RETRIES, sleep=time.sleep):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.sleep = sleep
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = []  # heap of (priority, arrival)
+        self._arrivals = itertools.count()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._stats = {'calls': 0, 'retries': 0, 'failed': 0, 'waited_s': 0.0}
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, running=self._running, queued=len(self._waiting))
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _acquire(self, ticket):
+        started = time.monotonic()
+        with self._cond:
+            # Published before the level is read, so a concurrent raise_to
+            # either is seen here or requeues the entry
+            ticket.scheduler = self
+            ticket.queued = (ticket.level, next(self._arrivals))
+            heapq.heappush(self._waiting, ticket.queued)
+            try:
+                while True:
+                    self._refill()
+                    first = self._waiting[0] == ticket.queued
+                    if first and self._running < self.max_concurrent and self._tokens >= 1:
+                        break
+                    # Only the head of the queue waits for a token; the others
+                    # are woken when the head moves on
+                    timeout = (1 - self._tokens) / self.rate if first and self._running < self.max_concurrent else None
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._waiting.remove(ticket.queued)
+                ticket.queued = None
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            ticket.queued = None
+            self._running += 1
+            self._tokens -= 1
+            self._stats['waited_s'] += time.monotonic() - started
+            self._cond.notify_all()
+
+    def _requeue(self, ticket):
+        with self._cond:
+            entry = ticket.queued
+            if entry is None or entry[0] <= ticket.level:
+                return
+            ticket.queued = (ticket.level, entry[1])
+            self._waiting[self._waiting.index(entry)] = ticket.queued
+            heapq.heapify(self._waiting)
+            self._cond.notify_all()
+
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def run(self, fn, level=None, max_retries=None):
+        """fn() once a slot and a token are free, retried while it fails transiently."""
+        ticket = _leading.get()
+        if ticket is None or level is not None:
+            ticket = _Ticket(_priority.get() if level is None else level)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in itertools.count():
+            self._acquire(ticket)
+            try:
+                with self._cond:
+                    self._stats['calls'] += 1
+                return fn()
+            except Exception as e:
+                if attempt >= max_retries or not is_retryable(e):
+                    with self._cond:
+                        self._stats['failed'] += 1
+                    raise
+                with self._cond:
+                    self._stats['retries'] += 1
+            finally:
+                self._release()
+            # Full jitter keeps retrying sessions from hitting the quota in step
+            self.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+
+_scheduler = Scheduler()
+
+
+def scheduler_stats():
+    return _scheduler.stats()
+
+
+def coalesce_stats():
+    """How many requests were made and how many joined one already in flight."""
+    with _lock:
+        return dict(_stats)
+
+
+def single_flight(key, fn):
+    """Run fn() once for all concurrent callers with the same key."""
+    level = _priority.get()
+    with _lock:
+        _stats['requests'] += 1
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = Future(), _Ticket(level)
+            _inflight[key] = flight
+            _stats['upstream'] += 1
+        else:
+            _stats['coalesced'] += 1
+    future, ticket = flight
+    if not leader:
+        # Joining queued background work must not demote an interactive caller
+        ticket.raise_to(level)
+        return future.result()
+
+    token = _leading.set(ticket)
+    try:
+        result = fn()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        _leading.reset(token)
+        with _lock:
+            del _inflight[key]
+
+
+def _key(kind, *parts):
+    return hashlib.sha256(json.dumps([kind, *parts], sort_keys=True).encode()).hexdigest()
+
+
+def get_info(obj):
+    """obj.getInfo(), shared with identical expressions already being computed."""
+    return single_flight(_key('getInfo', obj.serialize()), lambda: _scheduler.run(obj.getInfo))
+
+
+def compute_pixels(image, grid, file_format='NUMPY_NDARRAY'):
+    request = {'expression': image, 'fileFormat': file_format, 'grid': grid}
+    key = _key('computePixels', image.serialize(), grid, file_format)
+    return single_flight(key, lambda: _scheduler.run(lambda: ee.data.computePixels(request)))
+
+
+def get_map_id(image, vis_params):
+    return single_flight(_key('getMapId', image.serialize(), vis_params),
+                         lambda: _scheduler.run(lambda: image.getMapId(vis_params)))
+
+
+def get_asset(asset_id):
+    # Not retried: callers fall back to the updateTime they already know,
+    # which beats making a cache hit wait out the backoff
+    return single_flight(_key('getAsset', asset_id),
+                         lambda: _scheduler.run(lambda: ee.data.getAsset(asset_id), max_retries=0))
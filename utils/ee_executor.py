@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Earth Engine calls are blocking HTTPS requests, so threads are enough.
+# Shared by every session's fan_out: sized so one session's cache hits never
+# queue behind another's slow calls. utils.ee_client caps the requests that
+# actually go to Earth Engine, so most of these threads wait there or on a cache.
+MAX_WORKERS = int(os.environ.get('BIOMASS_FAN_OUT_WORKERS', '64'))
+PAGE_DEADLINE = 30  # seconds a page waits for its slowest call
+POLL_INTERVAL = 0.2
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="ee")
+_kept = set()  # futures a newer rerun must not cancel (see keep)
+_kept_lock = threading.Lock()
+
+
+def _run(fn, ctx, cancelled, delay=0):
+    # A call superseded during its delay never reaches Earth Engine
+    if cancelled.wait(delay) if delay else cancelled.is_set():
+        raise CancelledError()
+    if ctx is not None:
+        # Lets st.cache_data / st.error work inside the worker thread
+        add_script_run_ctx(threading.current_thread(), ctx)
+    return fn()
+
+
+def _cancel(run):
+    for cancelled, future in run:
+        with _kept_lock:
+            if future in _kept:
+                continue
+        cancelled.set()
+        future.cancel()
+
+
+def keep(future):
+    """Let a fan_out call finish even when a newer rerun of its page cancels the rest."""
+    with _kept_lock:
+        _kept.add(future)
+
+    def forget(done):
+        with _kept_lock:
+            _kept.discard(done)
+    future.add_done_callback(forget)
+
+
+def fan_out(calls, page, deadline=PAGE_DEADLINE, delay=0):
+    """Start all independent Earth Engine calls at once.
+
+    `calls` maps a name to a zero-argument callable. Returns the futures keyed
+    the same way once all of them finished or `deadline` seconds passed.
+    Calls left over from an earlier rerun of the same page are cancelled.
+    With `delay`, calls wait that many seconds before starting, so a burst
+    of reruns (e.g. while the user is still drawing) sends only the last one.
+    """
+    state_key = f"_ee_fan_out_{page}"
+    previous = st.session_state.get(state_key)
+    if previous is not None:
+        _cancel(previous)
+
+    ctx = get_script_run_ctx()
+    events = {name: threading.Event() for name in calls}
+    futures = {name: _executor.submit(_run, fn, ctx, events[name], delay) for name, fn in calls.items()}
+    run = [(events[name], futures[name]) for name in calls]
+    st.session_state[state_key] = run
+
+    pending = set(futures.values())
+    end = time.monotonic() + delay + deadline
+    try:
+        while pending and time.monotonic() < end:
+            _, pending = wait(pending, timeout=min(POLL_INTERVAL, end - time.monotonic()))
+            # Touching session state is a Streamlit yield point, so a newer
+            # rerun interrupts this one here instead of after the deadline
+            st.session_state.get(state_key)
+    except BaseException:
+        _cancel(run)
+        raise
+    return futures
+
+
+def get_result(future):
+    """Result of a fan_out call, raising if it missed the page deadline."""
+    if not future.done():
+        raise TimeoutError("Earth Engine did not respond before the page deadline")
+    return future.result()
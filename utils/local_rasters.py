@@ -0,0 +1,117 @@
+"""Exported AGB rasters on local disk.
+
+Each year is stored as agb_YYYY.npy (float32 in EPSG:4326, NaN outside the
+boundary or where there is no data) with an agb_YYYY.json sidecar:
+
+    {"bbox": [west, south, east, north], "update_time": "..."}
+
+update_time is only written for rasters the app downloaded itself (see
+utils.pixels.ensure_raster); hand exports leave it out and are never
+replaced.
+
+The .npy files are opened memory-mapped, so only the pixels a computation
+touches are read. A GeoTIFF (agb_YYYY.tif) is read instead when no .npy
+exists and rasterio is installed.
+"""
+import functools
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.disk_cache import CACHE_DIR
+
+RASTER_DIR = os.environ.get('BIOMASS_RASTER_DIR', os.path.join(CACHE_DIR, 'rasters'))
+EARTH_RADIUS = 6371008.8  # m
+
+
+class Raster:
+    """A north-up lon/lat grid with its pixel geometry."""
+
+    def __init__(self, data, bbox, update_time=None):
+        self.data = data
+        self.bbox = list(bbox)  # [west, south, east, north]
+        self.update_time = update_time
+        rows, cols = data.shape
+        west, south, east, north = self.bbox
+        self.pixel_width = (east - west) / cols
+        self.pixel_height = (north - south) / rows
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def pixel_index(self, lon, lat):
+        """(row, col) of the pixel containing a point, or None outside the grid."""
+        west, _, _, north = self.bbox
+        row = int((north - lat) // self.pixel_height)
+        col = int((lon - west) // self.pixel_width)
+        if 0 <= row < self.shape[0] and 0 <= col < self.shape[1]:
+            return row, col
+        return None
+
+    def row_area_ha(self):
+        """Area of one pixel in each row, in ha (pixels shrink towards the poles)."""
+        north = self.bbox[3]
+        edges = np.radians(north - self.pixel_height * np.arange(self.shape[0] + 1))
+        width = np.radians(self.pixel_width)
+        return EARTH_RADIUS ** 2 * width * np.abs(np.sin(edges[:-1]) - np.sin(edges[1:])) / 1e4
+
+
+def raster_path(year, directory=RASTER_DIR, suffix='.npy'):
+    return os.path.join(directory, f'agb_{year}{suffix}')
+
+
+def atomic_write(path, write, mode='wb'):
+    """Write a file through a temporary one and rename it into place.
+
+    Files here are memory-mapped by this and other processes; overwriting
+    one in place would crash them (SIGBUS), while a rename leaves their
+    mapping on the old file.
+    """
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, mode) as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def save_raster(year, data, bbox, update_time=None, directory=RASTER_DIR):
+    os.makedirs(directory, exist_ok=True)
+    # Data first: the sidecar's update_time is what marks the raster current
+    atomic_write(raster_path(year, directory), lambda f: np.save(f, np.asarray(data, dtype=np.float32)))
+    atomic_write(raster_path(year, directory, '.json'),
+                 lambda f: json.dump({'bbox': list(bbox), 'update_time': update_time}, f), mode='w')
+    open_raster.cache_clear()
+
+
+def _open_geotiff(path):
+    import rasterio
+
+    with rasterio.open(path) as src:
+        # Pixel areas and point lookups assume a north-up lon/lat grid
+        if src.crs is None or src.crs.to_epsg() != 4326:
+            raise ValueError(f"{path} is in {src.crs}, expected EPSG:4326; export it in EPSG:4326")
+        if src.transform.b != 0 or src.transform.d != 0 or src.transform.e >= 0:
+            raise ValueError(f"{path} is not a north-up grid")
+        data = src.read(1, masked=True).astype(np.float32).filled(np.nan)
+        bounds = src.bounds
+    return Raster(data, [bounds.left, bounds.bottom, bounds.right, bounds.top])
+
+
+@functools.lru_cache(maxsize=None)
+def open_raster(year, directory=RASTER_DIR):
+    """The raster for a year, or None when it has not been exported."""
+    path = raster_path(year, directory)
+    if os.path.exists(path):
+        with open(raster_path(year, directory, '.json')) as f:
+            meta = json.load(f)
+        return Raster(np.load(path, mmap_mode='r'), meta['bbox'], meta.get('update_time'))
+    tif = raster_path(year, directory, '.tif')
+    if os.path.exists(tif):
+        return _open_geotiff(tif)
+    return None
@@ -0,0 +1,71 @@
+"""Cached Earth Engine map IDs for the folium tile layers.
+
+Map.addLayer and geemap.ee_tile_layer call getMapId on every rerun, even
+when neither the image nor the visualization changed. Here the tile URL
+template is kept per (asset ID, vis params) for MAP_ID_TTL seconds, which
+is well below the lifetime of the map ID, and folium TileLayers are built
+straight from it.
+"""
+import json
+import threading
+import time
+
+import ee
+import folium
+
+from utils.ee_client import get_map_id
+from utils.tile_proxy import TILE_PROXY, get_proxy
+
+# Map IDs stay valid for several hours; refresh well before that
+MAP_ID_TTL = 2 * 3600  # seconds
+
+_tile_urls = {}  # key -> (fetched_at, url_format)
+_lock = threading.Lock()
+
+
+def _normalize_vis(vis_params):
+    vis = dict(vis_params or {})
+    if 'palette' in vis:
+        # getMapId wants RRGGBB; plotly palettes come as #RRGGBB
+        vis['palette'] = [str(color).lstrip('#') for color in vis['palette']]
+    if isinstance(vis.get('bands'), (list, tuple)):
+        vis['bands'] = ','.join(vis['bands'])
+    return vis
+
+
+def map_id_key(asset_id, vis_params):
+    """Cache key of one layer: the asset and its normalized vis params (incl. palette)."""
+    return json.dumps([asset_id, _normalize_vis(vis_params)], sort_keys=True)
+
+
+def tile_url(asset_id, vis_params):
+    """XYZ URL template for an image asset, from cache while its map ID is fresh."""
+    key = map_id_key(asset_id, vis_params)
+    with _lock:
+        cached = _tile_urls.get(key)
+    if cached is not None and time.time() - cached[0] < MAP_ID_TTL:
+        return cached[1]
+    map_id = get_map_id(ee.Image(asset_id), _normalize_vis(vis_params))
+    url = map_id['tile_fetcher'].url_format
+    with _lock:
+        _tile_urls[key] = (time.time(), url)
+    return url
+
+
+def tile_layer(asset_id, vis_params, name, shown=True, opacity=1.0):
+    """folium TileLayer for an image asset, like geemap.ee_tile_layer but cached."""
+    if TILE_PROXY:
+        # Browsers get the tiles from the local disk-backed proxy
+        tiles = get_proxy(tile_url).layer_url(asset_id, vis_params)
+    else:
+        tiles = tile_url(asset_id, vis_params)
+    return folium.raster_layers.TileLayer(
+        tiles=tiles,
+        attr="Google Earth Engine",
+        name=name,
+        overlay=True,
+        control=True,
+        show=shown,
+        opacity=opacity,
+        max_zoom=24,
+    )
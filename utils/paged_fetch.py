@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ee
+import pandas as pd
+import streamlit as st
+
+from utils.dashboard_data import rows_to_df, table_rows
+from utils.ee_client import get_info, keep_priority
+
+# Earth Engine refuses to return more than 5000 elements per request
+PAGE_SIZE = 5000
+MAX_PARALLEL_PAGES = 4
+
+
+def _fetch_page(collection, columns, offset, page_size):
+    page = ee.FeatureCollection(collection.toList(page_size, offset))
+    return rows_to_df(get_info(table_rows(page, columns)), columns)
+
+
+def fetch_table_paged(collection, columns, page_size=PAGE_SIZE,
+                      max_workers=MAX_PARALLEL_PAGES, show_progress=True):
+    """Download a large FeatureCollection in parallel pages of `page_size` features.
+
+    Pages are converted to DataFrames as they arrive and concatenated in
+    collection order. Progress is shown with st.progress unless disabled.
+    """
+    total = get_info(collection.size())
+    offsets = list(range(0, total, page_size))
+    if not offsets:
+        return rows_to_df([], columns)
+
+    bar = st.progress(0.0, text=f"Downloading {total} features") if show_progress else None
+    pages = [None] * len(offsets)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ee-page") as pool:
+        futures = {pool.submit(keep_priority(_fetch_page), collection, columns, offset, page_size): i
+                   for i, offset in enumerate(offsets)}
+        for done, future in enumerate(as_completed(futures), 1):
+            pages[futures[future]] = future.result()
+            if bar is not None:
+                bar.progress(done / len(offsets), text=f"Downloading {total} features: page {done}/{len(offsets)}")
+    if bar is not None:
+        bar.empty()
+    return pd.concat(pages, ignore_index=True)
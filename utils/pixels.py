@@ -0,0 +1,111 @@
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+import numpy as np
+
+from utils import assets
+from utils.disk_cache import asset_update_times
+from utils.ee_client import compute_pixels, keep_priority
+from utils.local_rasters import RASTER_DIR, Raster, open_raster, save_raster
+from utils.regions import DEFAULT_REGION, get_region, reduction_geometry
+
+PIXEL_SCALE = 100  # m
+METERS_PER_DEGREE = 111320
+# computePixels allows 32768 px per side and 48 MB per request; 1024² float32
+# tiles (4 MB) stay far below both and download well in parallel
+TILE_SIZE = 1024
+MAX_PARALLEL_TILES = 4
+NODATA = -9999
+
+# update_time of a raster downloaded while the asset's version was unknown
+UNKNOWN_VERSION = 'unknown'
+
+_download_locks = {}  # (year, directory) -> Lock
+_locks_guard = threading.Lock()
+
+
+def _grid(west, north, step, rows, cols):
+    return {
+        'dimensions': {'width': cols, 'height': rows},
+        'affineTransform': {
+            'scaleX': step, 'shearX': 0, 'translateX': west,
+            'shearY': 0, 'scaleY': -step, 'translateY': north,
+        },
+        'crsCode': 'EPSG:4326',
+    }
+
+
+def _fetch_tile(image, grid):
+    return compute_pixels(image, grid)['agbd']
+
+
+def fetch_pixels(year, scale=PIXEL_SCALE, region=DEFAULT_REGION):
+    """AGB pixels of the region's bounding box as a float32 array (NaN = masked).
+
+    The box is split into tiles that are downloaded in parallel and put
+    back together into one grid.
+    """
+    west, south, east, north = get_region(region).bbox
+    step = scale / METERS_PER_DEGREE
+    rows = math.ceil((north - south) / step)
+    cols = math.ceil((east - west) / step)
+
+    # Masked pixels come back as 0 otherwise, so mark them explicitly
+    image = (ee.Image(assets.agb(year)).select('agbd').toFloat()
+             .clip(reduction_geometry(region, scale))
+             .unmask(NODATA, False))
+
+    data = np.empty((rows, cols), dtype=np.float32)
+    tiles = [(r, c) for r in range(0, rows, TILE_SIZE) for c in range(0, cols, TILE_SIZE)]
+
+    def fetch(tile):
+        r, c = tile
+        height, width = min(TILE_SIZE, rows - r), min(TILE_SIZE, cols - c)
+        grid = _grid(west + c * step, north - r * step, step, height, width)
+        data[r:r + height, c:c + width] = _fetch_tile(image, grid)
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_TILES, thread_name_prefix="ee-pixels") as pool:
+        list(pool.map(keep_priority(fetch), tiles))
+
+    data[data == NODATA] = np.nan
+    return Raster(data, [west, north - rows * step, west + cols * step, north])
+
+
+def _download_lock(year, directory):
+    with _locks_guard:
+        return _download_locks.setdefault((year, directory), threading.Lock())
+
+
+def ensure_raster(year, directory=RASTER_DIR, download=True):
+    """The year's raster from disk, downloaded when missing or when the asset changed.
+
+    Only rasters downloaded here carry an update_time. One without it was
+    exported by hand (or is a GeoTIFF) and is kept as it is, without asking
+    Earth Engine. With download=False nothing is fetched and a missing
+    raster is None.
+    """
+    raster = open_raster(year, directory)
+    if not download or (raster is not None and raster.update_time is None):
+        return raster
+    update_time = asset_update_times([assets.agb(year)])[0]
+
+    def current():
+        raster = open_raster(year, directory)
+        if raster is not None and (update_time is None or raster.update_time == update_time):
+            return raster
+        return None
+
+    raster = current()
+    if raster is not None:
+        return raster
+    # Parallel callers (stats, histogram, yearly summary) wait for one download
+    with _download_lock(year, directory):
+        raster = current()
+        if raster is None:
+            fetched = fetch_pixels(year)
+            # Stamped even when the lookup failed, so it is refreshed later
+            save_raster(year, fetched.data, fetched.bbox, update_time or UNKNOWN_VERSION, directory)
+            raster = open_raster(year, directory)
+    return raster
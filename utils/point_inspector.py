@@ -0,0 +1,67 @@
+"""AGB time series of the pixel under a map click.
+
+Every year of the AGB stack and the 2021-2024 trend are sampled together
+in one request. Clicks are snapped to the 100 m grid of the local rasters
+(see utils.pixels) and results are kept in an LRU cache keyed by that
+pixel, so clicking again anywhere inside the same pixel costs nothing.
+"""
+import functools
+
+import ee
+
+from utils import assets
+from utils.agb_stack import AGBStack
+from utils.ee_client import get_info
+from utils.pixels import METERS_PER_DEGREE, PIXEL_SCALE
+from utils.regions import DEFAULT_REGION, get_region
+
+POINT_CACHE_SIZE = 512
+
+
+def _step(scale):
+    return scale / METERS_PER_DEGREE
+
+
+def snap_to_pixel(lon, lat, region=DEFAULT_REGION, scale=PIXEL_SCALE):
+    """(row, col) of the grid pixel containing a point, counted from the region's north-west corner."""
+    west, _, _, north = get_region(region).bbox
+    step = _step(scale)
+    return int((north - lat) // step), int((lon - west) // step)
+
+
+def pixel_centre(row, col, region=DEFAULT_REGION, scale=PIXEL_SCALE):
+    """(lon, lat) of a grid pixel's centre."""
+    west, _, _, north = get_region(region).bbox
+    step = _step(scale)
+    return west + (col + 0.5) * step, north - (row + 0.5) * step
+
+
+def point_query(lon, lat, scale=PIXEL_SCALE):
+    """AGB of every year and the trend at one point, as a single reduceRegion.
+
+    Unlike sampleRegions, which drops the point when any band is masked,
+    Reducer.first() returns None for each masked band on its own.
+    """
+    stack = AGBStack()
+    trend = ee.Image(assets.AGB_TREND).select('agbd').rename('trend')
+    return stack.image.addBands(trend).reduceRegion(ee.Reducer.first(), ee.Geometry.Point([lon, lat]), scale)
+
+
+def parse_point(result, years=assets.YEARS):
+    """{'agbd': {year: value}, 'trend': value}; None where the pixel is masked."""
+    values = result or {}
+    return {
+        'agbd': {year: values.get(f'agbd_{year}') for year in years},
+        'trend': values.get('trend'),
+    }
+
+
+@functools.lru_cache(maxsize=POINT_CACHE_SIZE)
+def pixel_series(row, col, region=DEFAULT_REGION):
+    """Time series of one grid pixel, sampled at its centre."""
+    lon, lat = pixel_centre(row, col, region)
+    return parse_point(get_info(point_query(lon, lat)))
+
+
+def point_series(lon, lat, region=DEFAULT_REGION):
+    return pixel_series(*snap_to_pixel(lon, lat, region), region)
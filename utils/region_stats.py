@@ -0,0 +1,69 @@
+import ee
+import pandas as pd
+import streamlit as st
+
+from utils import assets
+from utils.disk_cache import persistent_cache
+from utils.ee_client import get_info
+from utils.regions import DEFAULT_REGION, REGIONS, reduction_target
+
+PERCENTILES = [10, 50, 90]
+# Biomass classes in t/ha: 0-50, 50-100, ..., 250-300 and 300+
+CLASS_WIDTH = 50
+CLASS_COUNT = 7
+CLASS_LABELS = [f"{i * CLASS_WIDTH}–{(i + 1) * CLASS_WIDTH}" for i in range(CLASS_COUNT - 1)] + [
+    f"{(CLASS_COUNT - 1) * CLASS_WIDTH}+"]
+
+
+def region_stats_query(image, geometry, scale=100):
+    """Summary statistics and area per biomass class in one reduceRegion pass."""
+    agbd = image.select('agbd')
+    area = ee.Image.pixelArea().divide(1e4).rename('area_ha')
+    agb_class = agbd.divide(CLASS_WIDTH).floor().clamp(0, CLASS_COUNT - 1).int().rename('class')
+
+    # Input 0 (agbd) feeds the summary reducers, inputs 1-2 (area, class)
+    # feed the grouped area sum
+    summary = ee.Reducer.mean().combine(
+        ee.Reducer.min(), '', True
+    ).combine(
+        ee.Reducer.max(), '', True
+    ).combine(
+        ee.Reducer.stdDev(), '', True
+    ).combine(
+        ee.Reducer.percentile(PERCENTILES), '', True
+    )
+    reducer = summary.combine(ee.Reducer.sum().group(groupField=1, groupName='class'), '', False)
+
+    return agbd.addBands(area).addBands(agb_class).reduceRegion(
+        reducer=reducer,
+        geometry=geometry,
+        scale=scale,
+        maxPixels=1e10
+    )
+
+
+def parse_region_stats(result):
+    if not result or result.get('mean') is None:
+        return None
+    areas = {int(group['class']): group['sum'] for group in result.get('groups', [])}
+    stats = {
+        'mean': result['mean'],
+        'min': result.get('min'),
+        'max': result.get('max'),
+        'stddev': result.get('stdDev'),
+        'class_areas': pd.DataFrame({
+            'class': CLASS_LABELS,
+            'area_ha': [areas.get(i, 0.0) for i in range(CLASS_COUNT)],
+        }),
+    }
+    for p in PERCENTILES:
+        stats[f'p{p}'] = result.get(f'p{p}')
+    return stats
+
+
+@st.cache_data
+@persistent_cache(lambda year, region=DEFAULT_REGION: [assets.agb(year), REGIONS[region]])
+def fetch_region_stats(year: int, region=DEFAULT_REGION):
+    """Region statistics for one year and region."""
+    image, geometry = reduction_target(ee.Image(assets.agb(year)), region)
+    return parse_region_stats(get_info(region_stats_query(image, geometry)))
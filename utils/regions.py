@@ -0,0 +1,105 @@
+import functools
+
+import ee
+import streamlit as st
+
+from utils import assets
+from utils.disk_cache import persistent_cache
+from utils.ee_client import get_info
+
+# Region name -> boundary asset
+REGIONS = {
+    'cat_tien': assets.CAT_TIEN_BOUNDARY,
+}
+DEFAULT_REGION = 'cat_tien'
+# Tolerance (m) of the simplified outline handed to the browser
+GEOJSON_MAX_ERROR = 50
+
+
+@functools.lru_cache(maxsize=None)
+def region_geometry(name=DEFAULT_REGION):
+    """The region's ee.Geometry; building it makes no request."""
+    return ee.FeatureCollection(REGIONS[name]).geometry()
+
+
+def reduction_geometry(name=DEFAULT_REGION, scale=100):
+    """Boundary simplified to half the reduction scale.
+
+    The outline moves by at most scale/2, so only pixels along the
+    boundary can switch between inside and outside; totals drift slightly
+    (see benchmarks/region_geometry.py) in exchange for far fewer
+    vertices for the server to test. Use mode='full' in reduction_target
+    when exact boundary pixels matter.
+    """
+    return region_geometry(name).simplify(maxError=scale / 2)
+
+
+@functools.lru_cache(maxsize=None)
+def region_mask(name=DEFAULT_REGION):
+    """Boundary rasterized to an image that is 1 inside and masked outside."""
+    return ee.Image().byte().paint(ee.FeatureCollection(REGIONS[name]), 1).rename('mask')
+
+
+def reduction_target(image, name=DEFAULT_REGION, scale=100, mode='simplified'):
+    """(image, geometry) to reduce over the region.
+
+    mode is 'simplified' (default), 'full' for the original boundary, or
+    'mask' to clip with the rasterized boundary and reduce over its bounds.
+    """
+    if mode == 'full':
+        return image, region_geometry(name)
+    if mode == 'simplified':
+        return image, reduction_geometry(name, scale)
+    if mode == 'mask':
+        return image.updateMask(region_mask(name)), region_geometry(name).bounds(scale / 2)
+    raise ValueError(f"Unknown geometry mode: {mode}")
+
+
+@persistent_cache(lambda name: [REGIONS[name]])
+def fetch_region_info(name):
+    geometry = region_geometry(name)
+    info = get_info(ee.Dictionary({
+        'centroid': geometry.centroid(1).coordinates(),
+        'bounds': geometry.bounds(1).coordinates(),
+        'area_ha': geometry.area(1).divide(1e4),
+        'geojson': geometry.simplify(GEOJSON_MAX_ERROR),
+    }))
+    ring = info['bounds'][0]
+    lons = [lon for lon, _ in ring]
+    lats = [lat for _, lat in ring]
+    return {
+        'centroid': info['centroid'],
+        'bbox': [min(lons), min(lats), max(lons), max(lats)],
+        'area_ha': info['area_ha'],
+        'geojson': info['geojson'],
+    }
+
+
+class Region:
+    """A boundary with its ee geometry and its cached client-side values."""
+
+    def __init__(self, name, info):
+        self.name = name
+        self.asset_id = REGIONS[name]
+        self.geometry = region_geometry(name)
+        self.centroid = info['centroid']  # [lon, lat]
+        self.bbox = info['bbox']  # [west, south, east, north]
+        self.area_ha = info['area_ha']
+        self.geojson = info['geojson']
+
+    @property
+    def center(self):
+        """Centroid in folium's [lat, lon] order."""
+        return [self.centroid[1], self.centroid[0]]
+
+    @property
+    def bounds(self):
+        """Bounding box in folium's [[south, west], [north, east]] order."""
+        west, south, east, north = self.bbox
+        return [[south, west], [north, east]]
+
+
+@st.cache_resource
+def get_region(name=DEFAULT_REGION):
+    """Resolve a region once per process; its values come from the disk cache when possible."""
+    return Region(name, fetch_region_info(name))
@@ -0,0 +1,138 @@
+"""Statistics for a region of interest drawn on the map.
+
+Drawn shapes come back from the browser with full float precision and an
+arbitrary starting vertex, so the same polygon drawn twice rarely matches
+byte for byte. normalize_geometry rounds the coordinates and puts every
+ring in a canonical order; geometry_hash of the result is the cache key.
+"""
+import hashlib
+import json
+
+import ee
+import streamlit as st
+
+from utils import assets
+from utils.disk_cache import persistent_cache
+from utils.ee_client import get_info
+
+# 5 decimals ≈ 1 m, far below the 100 m reduction scale
+COORD_DECIMALS = 5
+# Seconds a newly drawn shape waits before it is reduced; a redraw in the
+# meantime cancels the pending request
+DEBOUNCE = 0.6
+ROI_SCALE = 100
+
+
+def _signed_area(ring):
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def _normalize_ring(ring, exterior):
+    points = []
+    for lon, lat in ring:
+        point = [float(round(lon, COORD_DECIMALS)), float(round(lat, COORD_DECIMALS))]
+        if not points or point != points[-1]:
+            points.append(point)
+    while len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if len(points) < 3:
+        return None
+    # GeoJSON winding: exterior rings counter-clockwise, holes clockwise
+    if (_signed_area(points) > 0) != exterior:
+        points.reverse()
+    start = points.index(min(points))
+    points = points[start:] + points[:start]
+    return points + [points[0]]
+
+
+def _normalize_polygon(rings):
+    exterior = _normalize_ring(rings[0], True) if rings else None
+    if exterior is None:
+        return None
+    holes = [h for h in (_normalize_ring(ring, False) for ring in rings[1:]) if h is not None]
+    return [exterior] + sorted(holes)
+
+
+def normalize_geometry(geometry):
+    """Canonical Polygon / MultiPolygon, or None for anything else.
+
+    Accepts a GeoJSON geometry or Feature, as returned by the draw control.
+    """
+    if geometry and geometry.get('type') == 'Feature':
+        geometry = geometry.get('geometry')
+    if not geometry:
+        return None
+    if geometry.get('type') == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry.get('type') == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return None
+    polygons = sorted(p for p in (_normalize_polygon(rings) for rings in polygons) if p is not None)
+    if not polygons:
+        return None
+    if len(polygons) == 1:
+        return {'type': 'Polygon', 'coordinates': polygons[0]}
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+def geometry_hash(geometry):
+    """Stable hash of a normalized geometry."""
+    payload = json.dumps(geometry, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def rectangle_bbox(geometry):
+    """[west, south, east, north] if a normalized geometry is an axis-aligned rectangle."""
+    if geometry['type'] != 'Polygon' or len(geometry['coordinates']) != 1:
+        return None
+    ring = geometry['coordinates'][0][:-1]
+    lons, lats = {x for x, _ in ring}, {y for _, y in ring}
+    if len(ring) != 4 or len(lons) != 2 or len(lats) != 2:
+        return None
+    return [min(lons), min(lats), max(lons), max(lats)]
+
+
+def roi_stats_query(image, geometry, scale=ROI_SCALE):
+    """Summary statistics and total AGB inside a drawn geometry, in one reduceRegion."""
+    agbd = image.select('agbd')
+    # t/ha × pixel area in ha = tons per pixel
+    tons = agbd.multiply(ee.Image.pixelArea().divide(1e4)).rename('tons')
+    reducer = ee.Reducer.mean().combine(
+        ee.Reducer.minMax(), '', True
+    ).combine(
+        ee.Reducer.stdDev(), '', True
+    ).combine(
+        ee.Reducer.count(), '', True
+    ).combine(
+        ee.Reducer.sum(), '', True
+    )
+    return agbd.addBands(tons).reduceRegion(
+        reducer=reducer,
+        geometry=ee.Geometry(geometry),
+        scale=scale,
+        maxPixels=1e10
+    )
+
+
+def parse_roi_stats(result):
+    if not result or not result.get('agbd_count'):
+        return None
+    return {
+        'mean': result['agbd_mean'],
+        'min': result.get('agbd_min'),
+        'max': result.get('agbd_max'),
+        'stddev': result.get('agbd_stdDev'),
+        'count': int(result['agbd_count']),
+        'total_t': result.get('tons_sum'),
+    }
+
+
+# The geometry is hashed into `key` by the caller, so the (large) GeoJSON
+# itself is left out of the in-memory cache key
+@st.cache_data(max_entries=256)
+@persistent_cache(lambda year, key, _geometry: [assets.agb(year)])
+def fetch_roi_stats(year: int, key: str, _geometry):
+    """Statistics of one year's AGB inside a normalized geometry."""
+    image = ee.Image(assets.agb(year))
+    return parse_roi_stats(get_info(roi_stats_query(image, _geometry)))
@@ -0,0 +1,105 @@
+"""Summed-area tables for instant rectangle totals.
+
+For a year's local raster we keep three integral images: AGB tons
+(agbd × pixel area), valid area in ha and valid pixel count. The total,
+mean and count inside any axis-aligned rectangle then take four lookups
+each. The tables are stored memory-mapped next to the raster and rebuilt
+only when the raster's source asset changes.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.local_rasters import RASTER_DIR, atomic_write
+from utils.pixels import ensure_raster
+
+TABLES = ['tons', 'area_ha', 'count']
+
+_lock = threading.Lock()
+_open = {}  # (year, directory) -> SummedAreaTable
+
+
+def _integral(values):
+    """Integral image with a leading row and column of zeros."""
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0, dtype=np.float64), axis=1, out=table[1:, 1:])
+    return table
+
+
+def build_tables(raster):
+    data = np.asarray(raster.data)
+    valid = np.isfinite(data)
+    area = np.where(valid, raster.row_area_ha()[:, None], 0.0)
+    return {
+        'tons': _integral(np.where(valid, data, 0.0) * area),
+        'area_ha': _integral(area),
+        'count': _integral(valid),
+    }
+
+
+class SummedAreaTable:
+    def __init__(self, tables, bbox, shape, update_time=None):
+        self.tables = tables
+        self.update_time = update_time
+        self.bbox = bbox  # [west, south, east, north] of the raster
+        self.rows, self.cols = shape
+        west, south, east, north = bbox
+        self.pixel_width = (east - west) / self.cols
+        self.pixel_height = (north - south) / self.rows
+
+    def _window(self, bbox):
+        """Row/column edges of the pixels whose centres fall inside bbox."""
+        west, south, east, north = bbox
+        r0 = int(np.clip(np.round((self.bbox[3] - north) / self.pixel_height), 0, self.rows))
+        r1 = int(np.clip(np.round((self.bbox[3] - south) / self.pixel_height), 0, self.rows))
+        c0 = int(np.clip(np.round((west - self.bbox[0]) / self.pixel_width), 0, self.cols))
+        c1 = int(np.clip(np.round((east - self.bbox[0]) / self.pixel_width), 0, self.cols))
+        return r0, max(r0, r1), c0, max(c0, c1)
+
+    def _sum(self, name, r0, r1, c0, c1):
+        t = self.tables[name]
+        return float(t[r1, c1] - t[r0, c1] - t[r1, c0] + t[r0, c0])
+
+    def rect_stats(self, bbox):
+        """Total AGB (t), area-weighted mean (t/ha), valid area and pixel count in a lon/lat box."""
+        window = self._window(bbox)
+        tons, area, count = (self._sum(name, *window) for name in TABLES)
+        return {
+            'total_t': tons,
+            'mean': tons / area if area > 0 else None,
+            'area_ha': area,
+            'count': int(round(count)),
+        }
+
+
+def _path(year, directory, name):
+    return os.path.join(directory, f'agb_{year}.sat_{name}.npy')
+
+
+def open_sat(year, directory=RASTER_DIR, download=True):
+    """The year's summed-area table, built from its raster on first use or after an update."""
+    with _lock:
+        raster = ensure_raster(year, directory, download)
+        if raster is None:
+            raise FileNotFoundError(f"No local AGB raster for {year} in {directory}")
+        cached = _open.get((year, directory))
+        if cached is not None and cached.update_time == raster.update_time:
+            return cached
+
+        meta_path = os.path.join(directory, f'agb_{year}.sat.json')
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta is None or meta.get('update_time') != raster.update_time:
+            # Other processes may have the old tables mapped: replace, never overwrite
+            for name, table in build_tables(raster).items():
+                atomic_write(_path(year, directory, name), lambda f, table=table: np.save(f, table))
+            atomic_write(meta_path, lambda f: json.dump({'update_time': raster.update_time}, f), mode='w')
+
+        tables = {name: np.load(_path(year, directory, name), mmap_mode='r') for name in TABLES}
+        sat = SummedAreaTable(tables, raster.bbox, raster.shape, raster.update_time)
+        _open[(year, directory)] = sat
+        return sat
@@ -0,0 +1,249 @@
+"""Multi-resolution statistics pyramid for polygon and viewport queries.
+
+Level k holds per-cell aggregates (sum, count, sum of squares, min, max and
+histogram bins) over blocks of 2^k × 2^k pixels of a year's local raster.
+A polygon query adds up cells that lie fully inside the polygon at the
+coarsest level possible and only descends into cells the boundary crosses.
+Refinement stops early once the pixels in undecided boundary cells are
+within `tolerance` of the pixels counted, and those cells are then taken
+or dropped whole by their centre; with tolerance=0 the answer is exact at
+pixel-centre resolution.
+"""
+import math
+import threading
+
+import numpy as np
+
+from utils.dashboard_data import HIST_BIN, HIST_MAX, HIST_MIN
+from utils.local_rasters import RASTER_DIR
+from utils.pixels import ensure_raster
+
+HIST_BINS = (HIST_MAX - HIST_MIN) // HIST_BIN
+# Stop adding levels once the coarsest grid is this small
+TOP_CELLS = 8
+DEFAULT_TOLERANCE = 0.01
+
+_lock = threading.Lock()
+_open = {}  # (year, directory) -> StatsPyramid
+
+
+def _empty():
+    return {'sum': 0.0, 'count': 0, 'sumsq': 0.0, 'min': np.inf, 'max': -np.inf,
+            'hist': np.zeros(HIST_BINS, dtype=np.int64)}
+
+
+def _bins(values):
+    """Histogram bin of each value, -1 outside [HIST_MIN, HIST_MAX)."""
+    bins = np.floor((values - HIST_MIN) / HIST_BIN).astype(np.int64)
+    bins[(values < HIST_MIN) | (values >= HIST_MAX)] = -1
+    return bins
+
+
+def _coarsen(level):
+    """Aggregate 2×2 blocks of cells into the next level."""
+    rows, cols = level['count'].shape
+
+    def blocks(a):
+        return a.reshape(rows // 2, 2, cols // 2, 2, *a.shape[2:])
+
+    return {
+        'sum': blocks(level['sum']).sum(axis=(1, 3)),
+        'count': blocks(level['count']).sum(axis=(1, 3)),
+        'sumsq': blocks(level['sumsq']).sum(axis=(1, 3)),
+        'min': blocks(level['min']).min(axis=(1, 3)),
+        'max': blocks(level['max']).max(axis=(1, 3)),
+        'hist': blocks(level['hist']).sum(axis=(1, 3)),
+    }
+
+
+def points_in_polygon(x, y, rings):
+    """Even-odd point-in-polygon test of many points against all rings."""
+    inside = np.zeros(x.shape, dtype=bool)
+    for ring in rings:
+        x0, y0 = ring[:, 0], ring[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        for ax, ay, bx, by in zip(x0, y0, x1, y1):
+            if ay == by:
+                continue
+            crosses = (ay > y) != (by > y)
+            x_cross = ax + (y - ay) * (bx - ax) / (by - ay)
+            inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def edges_cross_boxes(x0, y0, x1, y1, rings):
+    """Whether any polygon edge touches each closed box [x0, x1] × [y0, y1]."""
+    crossed = np.zeros(x0.shape, dtype=bool)
+    corners = [(x0, y0), (x1, y0), (x0, y1), (x1, y1)]
+    for ring in rings:
+        ax, ay = ring[:, 0], ring[:, 1]
+        bx, by = np.roll(ax, -1), np.roll(ay, -1)
+        for sx, sy, ex, ey in zip(ax, ay, bx, by):
+            near = ((min(sx, ex) <= x1) & (max(sx, ex) >= x0)
+                    & (min(sy, ey) <= y1) & (max(sy, ey) >= y0))
+            if not near.any():
+                continue
+            # The edge's line separates the box unless all corners lie strictly on one side
+            sides = [(ex - sx) * (cy - sy) - (ey - sy) * (cx - sx) for cx, cy in corners]
+            above = np.all([side > 0 for side in sides], axis=0)
+            below = np.all([side < 0 for side in sides], axis=0)
+            crossed |= near & ~above & ~below
+    return crossed
+
+
+def geojson_rings(geometry):
+    """Every ring of a GeoJSON Polygon or MultiPolygon as (n, 2) lon/lat arrays."""
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+    return [np.asarray(ring, dtype=np.float64) for polygon in polygons for ring in polygon]
+
+
+class StatsPyramid:
+    def __init__(self, raster):
+        self.raster = raster
+        self.update_time = raster.update_time
+        self.bbox = raster.bbox
+        rows, cols = raster.shape
+        self.levels_count = max(1, math.ceil(math.log2(max(rows, cols) / TOP_CELLS)))
+        size = 2 ** self.levels_count
+        padded_rows, padded_cols = -(-rows // size) * size, -(-cols // size) * size
+
+        # Level 0 stays the raw pixels; padding is NaN so it never counts
+        self.pixels = np.full((padded_rows, padded_cols), np.nan, dtype=np.float64)
+        self.pixels[:rows, :cols] = raster.data
+        valid = np.isfinite(self.pixels)
+        values = np.where(valid, self.pixels, 0.0)
+
+        # Level 1 histograms are counted straight from the pixels; a per-pixel
+        # one-hot level 0 would need HIST_BINS times the raster's memory
+        r, c = np.nonzero(valid)
+        bins = _bins(self.pixels[r, c])
+        cells = (r // 2) * (padded_cols // 2) + c // 2
+        counted = bins >= 0
+        hist = np.bincount(cells[counted] * HIST_BINS + bins[counted],
+                           minlength=padded_rows * padded_cols // 4 * HIST_BINS)
+        level = _coarsen({
+            'sum': values, 'count': valid.astype(np.int64), 'sumsq': values ** 2,
+            'min': np.where(valid, self.pixels, np.inf), 'max': np.where(valid, self.pixels, -np.inf),
+            'hist': np.zeros((padded_rows, padded_cols, 0), dtype=np.int32),
+        })
+        level['hist'] = hist.astype(np.int32).reshape(padded_rows // 2, padded_cols // 2, HIST_BINS)
+
+        self.levels = [None, level]  # level 0 is read from self.pixels
+        for _ in range(self.levels_count - 1):
+            level = _coarsen(level)
+            self.levels.append(level)
+
+    def _to_pixels(self, rings):
+        west, _, _, north = self.bbox
+        return [np.column_stack([(ring[:, 0] - west) / self.raster.pixel_width,
+                                 (north - ring[:, 1]) / self.raster.pixel_height]) for ring in rings]
+
+    def _add(self, acc, level, rows, cols):
+        cells = self.levels[level]
+        acc['sum'] += cells['sum'][rows, cols].sum()
+        acc['count'] += int(cells['count'][rows, cols].sum())
+        acc['sumsq'] += cells['sumsq'][rows, cols].sum()
+        if rows.size:
+            acc['min'] = min(acc['min'], cells['min'][rows, cols].min())
+            acc['max'] = max(acc['max'], cells['max'][rows, cols].max())
+        acc['hist'] += cells['hist'][rows, cols].sum(axis=0)
+
+    def _add_pixels(self, acc, rows, cols):
+        values = self.pixels[rows, cols]
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return
+        acc['sum'] += values.sum()
+        acc['count'] += values.size
+        acc['sumsq'] += (values ** 2).sum()
+        acc['min'] = min(acc['min'], values.min())
+        acc['max'] = max(acc['max'], values.max())
+        bins = _bins(values)
+        acc['hist'] += np.bincount(bins[bins >= 0], minlength=HIST_BINS)
+
+    def _classify(self, rows, cols, size, rings):
+        """0 = outside, 1 = inside, 2 = crossed by the boundary."""
+        x0, y0 = (cols * size).astype(np.float64), (rows * size).astype(np.float64)
+        crossed = edges_cross_boxes(x0, y0, x0 + size, y0 + size, rings)
+        # A cell no edge touches lies wholly on one side: any corner decides
+        corner = points_in_polygon(x0, y0, rings)
+        return np.where(crossed, 2, corner).astype(np.int8)
+
+    def polygon_stats(self, geometry, tolerance=DEFAULT_TOLERANCE):
+        """Statistics of the pixels whose centres fall inside a GeoJSON polygon."""
+        rings = self._to_pixels(geojson_rings(geometry))
+        vertices = np.vstack(rings)
+        acc = _empty()
+        uncertain = 0
+
+        level = self.levels_count
+        size = 2 ** level
+        top_rows, top_cols = self.levels[level]['count'].shape
+        rows, cols = (a.ravel() for a in np.meshgrid(np.arange(top_rows), np.arange(top_cols), indexing='ij'))
+        # Only cells touching the polygon's bounding box can matter
+        x_min, y_min = vertices.min(axis=0) // size
+        x_max, y_max = vertices.max(axis=0) // size
+        keep = (cols >= x_min) & (cols <= x_max) & (rows >= y_min) & (rows <= y_max)
+        rows, cols = rows[keep], cols[keep]
+
+        while level > 0 and rows.size:
+            size = 2 ** level
+            state = self._classify(rows, cols, size, rings)
+            inside = state == 1
+            self._add(acc, level, rows[inside], cols[inside])
+            rows, cols = rows[state == 2], cols[state == 2]
+
+            pending = int(self.levels[level]['count'][rows, cols].sum())
+            if pending <= tolerance * max(acc['count'], 1):
+                # Close enough: take or drop each boundary cell by its centre
+                centre = points_in_polygon((cols + 0.5) * size, (rows + 0.5) * size, rings)
+                self._add(acc, level, rows[centre], cols[centre])
+                uncertain = pending
+                rows = cols = np.empty(0, dtype=np.int64)
+                break
+
+            # Descend into the four children of every boundary cell
+            rows = (rows[:, None] * 2 + np.array([0, 0, 1, 1])).ravel()
+            cols = (cols[:, None] * 2 + np.array([0, 1, 0, 1])).ravel()
+            level -= 1
+
+        if rows.size:
+            centre = points_in_polygon(cols + 0.5, rows + 0.5, rings)
+            self._add_pixels(acc, rows[centre], cols[centre])
+
+        count = acc['count']
+        mean = acc['sum'] / count if count else None
+        return {
+            'mean': mean,
+            'stddev': math.sqrt(max(acc['sumsq'] / count - mean ** 2, 0.0)) if count else None,
+            'min': float(acc['min']) if count else None,
+            'max': float(acc['max']) if count else None,
+            'count': count,
+            'hist': acc['hist'],
+            # Pixels in boundary cells decided by their centre; 0 when exact
+            'uncertain_pixels': uncertain,
+        }
+
+    def bbox_stats(self, bbox, tolerance=DEFAULT_TOLERANCE):
+        """Statistics for a lon/lat viewport."""
+        west, south, east, north = bbox
+        ring = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+        return self.polygon_stats({'type': 'Polygon', 'coordinates': [ring]}, tolerance)
+
+
+def open_pyramid(year, directory=RASTER_DIR, download=True):
+    """The year's pyramid, rebuilt when its raster's source asset changes."""
+    with _lock:
+        raster = ensure_raster(year, directory, download)
+        if raster is None:
+            raise FileNotFoundError(f"No local AGB raster for {year} in {directory}")
+        cached = _open.get((year, directory))
+        if cached is None or cached.update_time != raster.update_time:
+            cached = StatsPyramid(raster)
+            _open[(year, directory)] = cached
+        return cached
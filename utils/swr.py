@@ -0,0 +1,115 @@
+"""Stale-while-revalidate for the values a page renders.
+
+Each successful result is remembered as the "last good" value of its key,
+with the time it was first fetched, in a store that asset updates never
+invalidate (SQLite or Redis, following BIOMASS_CACHE_BACKEND). A page
+waits only STALE_WAIT seconds for fresh values when every value it needs
+has a last good copy, and the usual PAGE_DEADLINE otherwise. Whatever is
+not ready by then (or failed) is rendered from that copy with an "as of"
+time, while the fresh request keeps running in the background and
+replaces the copy when it completes.
+"""
+import hashlib
+import os
+import threading
+import time
+
+from utils import cache_codec
+from utils.disk_cache import CACHE_BACKEND, CACHE_DIR, DiskCache, RedisCache, make_key
+from utils.ee_executor import PAGE_DEADLINE, get_result, keep
+
+# Long enough for cache hits, short enough to feel instant
+STALE_WAIT = 0.5
+
+_store = None
+_store_lock = threading.Lock()
+_remembered = {}  # store key -> digest of the value this process last wrote
+_refreshing = set()  # store keys with a background refresh kept running
+
+
+def _get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            # Shared between processes like the result cache
+            if CACHE_BACKEND == 'redis':
+                _store = RedisCache(prefix='biomass:last_good:')
+            else:
+                _store = DiskCache(os.path.join(CACHE_DIR, 'last_good.sqlite'))
+        return _store
+
+
+def _store_key(key):
+    return make_key('swr', [], *key)
+
+
+def last_good(key):
+    """(value, fetched_at) last seen for key, or None."""
+    found, entry = _get_store().get(_store_key(key), [])
+    return entry if found else None
+
+
+def remember(key, value):
+    """Store value as key's last good copy unless this process already did."""
+    if value is None:
+        return
+    store_key = _store_key(key)
+    # Renders mostly get the same cached value again: skip the write
+    digest = hashlib.sha256(cache_codec.dumps(value)).hexdigest()
+    with _store_lock:
+        if _remembered.get(store_key) == digest:
+            return
+        _remembered[store_key] = digest
+    _get_store().set(store_key, [], (value, time.time()))
+
+
+def has_last_good(key):
+    """Whether key has a last good copy, without loading it."""
+    return _get_store().contains(_store_key(key))
+
+
+def render_deadline(keys):
+    """How long a render should wait for the fresh values of these keys."""
+    if all(has_last_good(key) for key in keys):
+        return STALE_WAIT
+    # Without a copy to fall back on, a late value is an error
+    return PAGE_DEADLINE
+
+
+def _remember_when_done(key):
+    def callback(future):
+        with _store_lock:
+            _refreshing.discard(_store_key(key))
+        if not future.cancelled() and future.exception() is None:
+            remember(key, future.result())
+    return callback
+
+
+def _refresh(future, key):
+    """Keep one late call per key running past later reruns and remember its value."""
+    with _store_lock:
+        if _store_key(key) in _refreshing:
+            return
+        _refreshing.add(_store_key(key))
+    keep(future)
+    future.add_done_callback(_remember_when_done(key))
+
+
+def resolve(future, key):
+    """(value, as_of) for a fan_out call: as_of is None when the value is fresh.
+
+    Falls back to the last good value while the call is still running or
+    after it failed; without one, raises like get_result.
+    """
+    if future.done() and not future.cancelled() and future.exception() is None:
+        value = future.result()
+        remember(key, value)
+        return value, None
+    stale = last_good(key)
+    if stale is None:
+        return get_result(future), None
+    if not future.done():
+        # Refresh in the background, even if the user reruns the page
+        # meanwhile; the next render picks it up
+        _refresh(future, key)
+    return stale
@@ -0,0 +1,230 @@
+"""Optional local XYZ proxy that caches Earth Engine map tiles on disk.
+
+Without it every browser fetches every tile straight from Earth Engine.
+With BIOMASS_TILE_PROXY=1 a small HTTP server runs in a background thread
+of the app process and the folium layers point at it instead:
+
+    /tiles/<layer>/<z>/<x>/<y>   tile, fetched from Earth Engine once
+    /stats                       hit/miss counters as JSON
+
+<layer> hashes the asset ID, its updateTime and the vis params, so tiles
+of an updated asset or another palette never mix with old ones. The
+upstream URL is only resolved on a miss, through the `resolve` function
+given to the proxy (normally utils.map_tiles.tile_url). Tiles are kept
+below BIOMASS_TILE_CACHE_MAX_MB by removing the least recently served
+ones, which also clears out layers nobody asks for any more.
+"""
+import hashlib
+import json
+import os
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.disk_cache import CACHE_DIR, asset_update_times
+
+TILE_PROXY = os.environ.get('BIOMASS_TILE_PROXY', '') not in ('', '0')
+TILE_PROXY_HOST = os.environ.get('BIOMASS_TILE_PROXY_HOST', '127.0.0.1')
+TILE_PROXY_PORT = int(os.environ.get('BIOMASS_TILE_PROXY_PORT', '8765'))
+# Address the browser uses to reach the proxy (differs behind a reverse proxy)
+TILE_PROXY_URL = os.environ.get('BIOMASS_TILE_PROXY_URL', f'http://localhost:{TILE_PROXY_PORT}')
+TILE_DIR = os.path.join(CACHE_DIR, 'tiles')
+# Tiles of a layer never change, the layer key changes instead
+TILE_MAX_AGE = 7 * 24 * 3600  # seconds
+UPSTREAM_TIMEOUT = 30
+TILE_MAX_BYTES = int(float(os.environ.get('BIOMASS_TILE_CACHE_MAX_MB', '1024')) * 1024 * 1024)
+# Sweep after writing this share of the limit; sweeps stop at 90% of it
+SWEEP_SHARE = 0.1
+
+
+class TileProxy:
+    def __init__(self, resolve, directory=TILE_DIR, max_bytes=TILE_MAX_BYTES):
+        self.resolve = resolve
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.layers = {}  # layer key -> (asset_id, vis_params)
+        self._stats = {'hits': 0, 'misses': 0, 'errors': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        # Sweep on the first miss: tiles from before a restart count too
+        self._written = max_bytes * SWEEP_SHARE
+
+    def register(self, asset_id, vis_params, version=None):
+        """Key under which a layer's tiles are served and stored."""
+        payload = json.dumps([asset_id, vis_params, version], sort_keys=True, default=str)
+        key = hashlib.sha1(payload.encode()).hexdigest()[:16]
+        with self._lock:
+            known = key in self.layers
+            self.layers[key] = (asset_id, vis_params)
+        if not known:
+            # Saved next to the tiles so a proxy in another app process can
+            # resolve the layer too
+            os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+            with open(os.path.join(self.directory, key, 'layer.json'), 'w') as f:
+                json.dump({'asset_id': asset_id, 'vis_params': vis_params}, f)
+        return key
+
+    def layer_url(self, asset_id, vis_params, base_url=TILE_PROXY_URL):
+        """XYZ URL template of a layer served through the proxy."""
+        version = asset_update_times([asset_id])[0]
+        return f'{base_url}/tiles/{self.register(asset_id, vis_params, version)}/{{z}}/{{x}}/{{y}}'
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        served = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / served if served else None
+        return stats
+
+    def _path(self, layer, z, x, y):
+        return os.path.join(self.directory, layer, str(z), str(x), f'{y}.png')
+
+    def sweep(self):
+        """Remove the least recently served tiles until the cache is below 90% of max_bytes."""
+        tiles = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.png'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    tiles.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in tiles)
+        if total <= self.max_bytes:
+            return
+        tiles.sort()
+        for _, size, path in tiles:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._count('evicted')
+            total -= size
+            if total <= self.max_bytes * 0.9:
+                break
+        # Directories stay: a concurrent miss may be writing into them
+
+    def _wrote(self, n):
+        with self._lock:
+            self._written += n
+            due = self._written >= self.max_bytes * SWEEP_SHARE
+            if due:
+                self._written = 0
+        # One sweep at a time; others keep serving
+        if due and self._sweep_lock.acquire(blocking=False):
+            try:
+                self.sweep()
+            finally:
+                self._sweep_lock.release()
+
+    def _layer(self, layer):
+        with self._lock:
+            source = self.layers.get(layer)
+        if source is not None:
+            return source
+        meta_path = os.path.join(self.directory, layer, 'layer.json')
+        if not layer.isalnum() or not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return meta['asset_id'], meta['vis_params']
+
+    def tile(self, layer, z, x, y):
+        """(status, PNG bytes) of one tile, from disk when it was fetched before."""
+        if not layer.isalnum():
+            return 404, b''
+        path = self._path(layer, z, x, y)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+                # The modification time orders tiles for eviction
+                os.utime(path)
+            except FileNotFoundError:
+                pass  # evicted meanwhile: fetch it again
+            else:
+                self._count('hits')
+                return 200, body
+
+        source = self._layer(layer)
+        if source is None:
+            return 404, b''
+        try:
+            url = self.resolve(*source).format(z=z, x=x, y=y)
+            with urllib.request.urlopen(url, timeout=UPSTREAM_TIMEOUT) as response:
+                body = response.read()
+        except Exception:
+            # Not cached, so the next request tries again
+            self._count('errors')
+            return 502, b''
+        self._count('misses')
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+        self._wrote(len(body))
+        return 200, body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        proxy = self.server.proxy
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if parts == ['stats']:
+            self._send(200, json.dumps(proxy.stats()).encode(), 'application/json', 'no-store')
+            return
+        if len(parts) == 5 and parts[0] == 'tiles' and all(p.isdigit() for p in parts[2:]):
+            status, body = proxy.tile(parts[1], *map(int, parts[2:]))
+            cache = f'public, max-age={TILE_MAX_AGE}, immutable' if status == 200 else 'no-store'
+            self._send(status, body, 'image/png', cache)
+            return
+        self._send(404, b'', 'text/plain', 'no-store')
+
+    def _send(self, status, body, content_type, cache_control):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(proxy, host=TILE_PROXY_HOST, port=TILE_PROXY_PORT):
+    """Run the proxy's HTTP server in a daemon thread and return the server."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.proxy = proxy
+    threading.Thread(target=server.serve_forever, name="tile-proxy", daemon=True).start()
+    return server
+
+
+_proxy = None
+_proxy_lock = threading.Lock()
+
+
+def get_proxy(resolve):
+    """The process-wide proxy, started on first use."""
+    global _proxy
+    with _proxy_lock:
+        if _proxy is None:
+            proxy = TileProxy(resolve)
+            try:
+                serve(proxy)
+            except OSError:
+                # Port taken: another app process already runs the proxy, and
+                # it finds this process's layers through their layer.json
+                pass
+            _proxy = proxy
+        return _proxy